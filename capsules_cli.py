@@ -1,5 +1,6 @@
-﻿import argparse, csv, gzip, hashlib, json, math, os, random, sys, time
-from collections import Counter, defaultdict
+﻿import argparse, csv, gzip, hashlib, io, json, math, multiprocessing, os, random, secrets, signal, stat, sys, tempfile, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
 from typing import List, Dict, Tuple
 import numpy as np
 
@@ -12,6 +13,11 @@ try:
     import networkx as nx
 except Exception:
     nx = None
+try:
+    import scipy.sparse as sps
+    from scipy.sparse.linalg import eigsh
+except Exception:
+    sps = None
 
 # ---------- utils ----------
 def now_iso() -> str:
@@ -23,6 +29,122 @@ def sha256_path(p:str) -> str:
         for chunk in iter(lambda: f.read(1<<20), b""): h.update(chunk)
     return h.hexdigest()
 
+SIDECAR_MIN = int(os.environ.get("HARSH_SIDECAR_MIN", "1024"))
+
+def sidecar_array(arr, manifest_path, min_size=None):
+    """
+    Small arrays are inlined as JSON lists. Arrays with >= SIDECAR_MIN elements are
+    written once as content-addressed sidecars/<sha256>.npy next to the manifest and
+    referenced by digest, shape and dtype, so the manifest stays small to canonicalize.
+    """
+    arr = np.ascontiguousarray(arr)
+    if arr.size < (SIDECAR_MIN if min_size is None else min_size):
+        return arr.tolist()
+    buf = io.BytesIO(); np.save(buf, arr, allow_pickle=False); data = buf.getvalue()
+    sha = hashlib.sha256(data).hexdigest()
+    rel = f"sidecars/{sha}.npy"
+    path = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), rel)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f: f.write(data)
+    return {"sidecar": "npy", "path": rel, "sha256": sha, "shape": list(arr.shape), "dtype": arr.dtype.str}
+
+def load_array(ref, manifest_path):
+    """Inverse of sidecar_array: inline list -> array, or hash-checked load of the referenced .npy."""
+    if not (isinstance(ref, dict) and ref.get("sidecar") == "npy"):
+        return np.asarray(ref)
+    path = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), ref["path"])
+    got = sha256_path(path)
+    if got != ref["sha256"]:
+        raise RuntimeError(f"{path}: sha256 {got} != manifest {ref['sha256']}")
+    return np.load(path, allow_pickle=False)
+
+CHECKPOINT_VERSION = 1
+
+def write_checkpoint(path, kind, meta, **arrays) -> dict:
+    """
+    Sufficient statistics as a versioned .npz (JSON header + integer arrays).
+    Returns the manifest reference {path, sha256, kind, version}.
+    """
+    if not path.endswith(".npz"): path += ".npz"
+    header = json.dumps({"kind": kind, "version": CHECKPOINT_VERSION, **meta}, sort_keys=True)
+    np.savez_compressed(path, header=np.frombuffer(header.encode("utf-8"), dtype=np.uint8), **arrays)
+    return {"path": path, "sha256": sha256_path(path), "kind": kind, "version": CHECKPOINT_VERSION}
+
+def read_checkpoint(path):
+    with np.load(path) as z:
+        header = json.loads(bytes(z["header"]).decode("utf-8"))
+        arrays = {k: z[k] for k in z.files if k != "header"}
+    if header.get("version") != CHECKPOINT_VERSION:
+        raise RuntimeError(f"{path}: checkpoint version {header.get('version')} != {CHECKPOINT_VERSION}")
+    return header, arrays
+
+def nbytes(obj) -> int:
+    """Rough resident size of a cached value: numpy buffers, containers of them, networkx graphs."""
+    if isinstance(obj, np.ndarray): return obj.nbytes
+    if isinstance(obj, (tuple, list)): return sum(nbytes(o) for o in obj)
+    if isinstance(obj, dict): return sum(nbytes(o) for o in obj.values())
+    if sps is not None and sps.issparse(obj):
+        return sum(getattr(obj, k).nbytes for k in ("data", "indices", "indptr") if hasattr(obj, k))
+    if nx is not None and isinstance(obj, nx.Graph):
+        return 300 * obj.number_of_nodes() + 500 * obj.number_of_edges()
+    return sys.getsizeof(obj)
+
+class InputCache:
+    """
+    Parsed inputs (OD arrays, interval starts/ends, edge lists, adjacency) keyed by
+    (kind, path, size, mtime_ns, parse options) and evicted least-recently-used once
+    the total exceeds max_bytes. Thread-safe; concurrent misses on one key load once.
+    Cached arrays are made read-only, so capsules must not modify them in place.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()   # key -> (value, nbytes)
+        self.loading = {}              # key -> Lock held while the first caller loads it
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def file_key(path):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+    def get(self, kind, path, opts, load):
+        key = (kind,) + self.file_key(path) + tuple(opts)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key); self.hits += 1
+                return self.entries[key][0]
+            key_lock = self.loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key); self.hits += 1
+                    return self.entries[key][0]
+            value = load()
+            for a in (value if isinstance(value, tuple) else (value,)):
+                if isinstance(a, np.ndarray): a.flags.writeable = False
+            size = nbytes(value)
+            with self.lock:
+                self.misses += 1
+                self.entries[key] = (value, size)
+                self.loading.pop(key, None)
+                total = sum(n for _, n in self.entries.values())
+                while total > self.max_bytes and len(self.entries) > 1:
+                    _, (_, n) = self.entries.popitem(last=False); total -= n
+        return value
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": sum(n for _, n in self.entries.values()),
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+                    "keys": [[k[0], os.path.basename(k[1])] + list(k[4:]) for k in self.entries]}
+
+INPUTS = InputCache(int(os.environ.get("HARSH_CACHE_MB", "2048")) << 20)
+
+def input_sha256(path) -> str:
+    return INPUTS.get("sha256", path, (), lambda: sha256_path(path))
+
 def lz78_bits_per_symbol(seq, max_symbols=500_000):
     if len(seq) > max_symbols:
         seq = seq[:max_symbols]
@@ -48,46 +170,235 @@ def lz78_bits_per_symbol(seq, max_symbols=500_000):
             i = j
     return bits / max(1,n)
 
+def context_count_table(pu_idx, do_idx, K, S):
+    """
+    Counts of (order-K context, destination) over the interleaved stream
+    ... PU_{t-1}, DO_{t-1}, PU_t -> DO_t, packed as one int64 key per trip
+    (destination in the lowest base-S digit, most recent context symbol next).
+    Returned as sorted unique keys + counts, so memory follows observed contexts.
+    Order 1 is exactly the D|P table.
+    """
+    if S ** (K+1) >= 2**63:
+        raise ValueError(f"order {K} with {S} states does not fit a 64-bit context key")
+    z = np.empty(2*len(pu_idx), dtype=np.int64)
+    z[0::2] = pu_idx; z[1::2] = do_idx
+    t0 = K // 2                       # first trip with a full order-K context
+    pos = 2*np.arange(t0, len(pu_idx)) + 1
+    keys = z[pos].copy()
+    for j in range(1, K+1):
+        keys += z[pos-j] * S**j
+    return np.unique(keys, return_counts=True)
+
+def conditional_entropies(keys, counts, K, S):
+    """H(DO_t | last k symbols) in bits for k=1..K, marginalized from the order-K table."""
+    out = {}
+    for k in range(K, 0, -1):
+        if k < K:
+            keys, inv = np.unique(keys % S**(k+1), return_inverse=True)
+            counts = np.bincount(inv.ravel(), weights=counts).astype(np.int64)
+        ctx, grp = np.unique(keys // S, return_inverse=True)
+        n_ctx = np.bincount(grp.ravel(), weights=counts)
+        N = counts.sum()
+        H = float(-np.sum(counts/N * np.log2(counts / n_ctx[grp.ravel()]))) if N else 0.0
+        out[str(k)] = {"bits": H, "n_contexts": int(len(ctx)), "n_keys": int(len(keys))}
+    return dict(sorted(out.items(), key=lambda kv: int(kv[0])))
+
+def stationary_pi(P, v0=None, tol=0.0, max_iter=200):
+    """
+    Power iteration v <- v @ P from v0 (uniform by default), normalized once at the end.
+    With tol > 0 it stops when the L1 change of the normalized iterate drops below tol.
+    Returns (pi, iterations, converged); tol=0 is the fixed 200-step headline estimator.
+    pi is None when all mass leaks into states without outgoing trips.
+    """
+    n = P.shape[0]
+    v = np.ones(n)/n if v0 is None else v0
+    prev = v / v.sum()
+    for it in range(1, max_iter + 1):
+        v = v @ P
+        if tol > 0:
+            z = v.sum()
+            if not z > 0: return None, it, False
+            v = cur = v / z   # renormalized each step so leaky chains cannot underflow
+            if np.abs(cur - prev).sum() < tol: return cur, it, True
+            prev = cur
+    z = v.sum()
+    return (v / z if z > 0 and np.isfinite(z) else None), max_iter, False
+
+def entropy_rate_bits(P, pi) -> float:
+    def H_row(p):
+        mask = p>0
+        return float(-np.sum(p[mask]*np.log2(p[mask])))
+    return float(sum(pi[i]*H_row(P[i]) for i in range(P.shape[0])))
+
+def windowed_rates(pu_idx, do_idx, ts, S, window, step, stride, lz_cap, tol=1e-10, max_iter=200):
+    """
+    OD entropy rate, stationary vector and LZ78 rate over sliding time windows
+    [t0 + i*step, t0 + i*step + window) of the time-sorted trips. The S x S count
+    matrix is updated incrementally (trips entering are added, trips leaving are
+    removed). pi uses the same estimator as od_entropy_rate: warm-started from the
+    previous window's pi until the L1 change is below tol; a window that has not
+    converged by max_iter is redone exactly as the headline (200 steps from uniform).
+    """
+    f = pu_idx * S + do_idx
+    C = np.zeros(S*S, dtype=np.int64)
+    t0 = ts[0] - ts[0] % step
+    starts = np.arange(t0, ts[-1] + 1, step, dtype=np.int64)
+    los = np.searchsorted(ts, starts, "left"); his = np.searchsorted(ts, starts + window, "left")
+    # empty windows are skipped: outlier timestamps (years off) would otherwise emit long all-null runs
+    keep = his > los
+    starts, los, his = starts[keep], los[keep], his[keep]
+    cur_lo = cur_hi = 0
+    pi = np.ones(S) / S
+    out = {"window_start": [], "n_pairs": [], "n_states": [], "entropy_rate_bits_per_step": [],
+           "lz78_bits_per_symbol": [], "pi_entropy_bits": [], "pi_iterations": []}
+    for w0, lo, hi in zip(starts, los, his):
+        if lo >= cur_hi:
+            C[:] = 0; np.add.at(C, f[lo:hi], 1)
+        else:
+            np.add.at(C, f[cur_lo:lo], -1); np.add.at(C, f[cur_hi:hi], 1)
+        cur_lo, cur_hi = lo, hi
+        out["window_start"].append(pd.Timestamp(int(w0)).isoformat())
+        out["n_pairs"].append(int(hi - lo))
+        M = C.reshape(S, S)
+        rows = M.sum(axis=1)
+        act = np.flatnonzero((rows > 0) | (M.sum(axis=0) > 0))
+        Ma = M[np.ix_(act, act)].astype(np.float64)
+        ra = Ma.sum(axis=1, keepdims=True)
+        P = np.divide(Ma, ra, out=np.zeros_like(Ma), where=ra > 0)
+        v0 = pi[act]
+        v0 = v0 / v0.sum() if v0.sum() > 0 else None
+        v, it, ok = stationary_pi(P, v0, tol, max_iter)
+        if not ok:
+            v, extra, _ = stationary_pi(P); it += extra
+        out["n_states"].append(int(len(act)))
+        out["lz78_bits_per_symbol"].append(lz78_bits_per_symbol(do_idx[lo:hi:stride].tolist(), max_symbols=lz_cap))
+        if v is None:   # all mass leaked (e.g. a window's trips end where none start): no estimate
+            pi = np.ones(S) / S
+            out["entropy_rate_bits_per_step"].append(None); out["pi_entropy_bits"].append(None)
+            out["pi_iterations"].append(it)
+            continue
+        pi = np.zeros(S); pi[act] = v
+        with np.errstate(divide="ignore", invalid="ignore"):
+            Hpi = float(-np.sum(np.where(v > 0, v*np.log2(v), 0.0)))
+        out["entropy_rate_bits_per_step"].append(entropy_rate_bits(P, v))
+        out["pi_entropy_bits"].append(Hpi)
+        out["pi_iterations"].append(it)
+    return out
+
+def od_entropy_rate(C) -> float:
+    """H_rate = sum_i pi_i H(P_i*) for P = row-normalized OD counts, pi by 200 power steps from uniform."""
+    S = C.shape[0]
+    rows = C.sum(axis=1, keepdims=True)
+    P = np.divide(C, rows, out=np.zeros((S,S), dtype=np.float64), where=rows > 0)
+    pi, _, _ = stationary_pi(P)
+    if pi is None:
+        raise RuntimeError("OD chain leaks all probability mass (every path ends at a state with no outgoing trips)")
+    return entropy_rate_bits(P, pi)
+
+def bmo_block(vals, block):
+    """
+    max over start i of mean |x - mean| on vals[i:i+block] (truncated at the end).
+    Vectorized over i; column-by-column accumulation keeps Python's left-to-right
+    summation order, so results match the scalar loop bit for bit.
+    """
+    v = np.asarray(vals, dtype=np.float64); n = len(v)
+    if n == 0: return 0.0
+    pad = np.concatenate([v, np.zeros(block)])
+    L = np.minimum(block, n - np.arange(n)).astype(np.float64)
+    S = np.zeros(n)
+    for c in range(block):
+        S += pad[c:c+n]
+    mean = S / L
+    D = np.zeros(n)
+    for c in range(block):
+        D += np.where(c < L, np.abs(pad[c:c+n] - mean), 0.0)
+    return max(0.0, float((D / L).max()))
+
+def bmo_metrics(dens) -> dict:
+    bmo16, bmo32, bmo64 = bmo_block(dens,16), bmo_block(dens,32), bmo_block(dens,64)
+    bmo_star = max(bmo16, bmo32, bmo64)
+    c1, c2 = 2.0, 0.5
+    alpha_star = c2 / max(1e-12, bmo_star)
+    ceiling = c1 * math.exp(-c2 / max(1e-12, bmo_star))
+    return {
+        "n_windows": len(dens),
+        "bmo_16": bmo16,
+        "bmo_32": bmo32,
+        "bmo_64": bmo64,
+        "bmo_star": bmo_star,
+        "john_nirenberg": {
+            "c1": c1, "c2": c2,
+            "alpha_star": alpha_star,
+            "ceiling_proxy": ceiling
+        }
+    }
+
 # ---------- capsules ----------
+def read_od(path, origin, dest, time_col=None, nulls="rows"):
+    """
+    (PU, DO, pickup ns or None) integer arrays; sorted by time_col when given. nulls="rows"
+    drops a trip with a null in any used column, so PU/DO stay paired. nulls="columns" is the
+    original behaviour (no time_col only): each column drops its own nulls and the longer one
+    is truncated later, which shifts PU/DO pairs after the first null.
+    """
+    if nulls == "columns":
+        df = pd.read_parquet(path, columns=[origin, dest])
+        pu = df[origin].astype("Int64").dropna().astype(int).to_numpy()
+        do = df[dest].astype("Int64").dropna().astype(int).to_numpy()
+        return pu, do, None
+    df = pd.read_parquet(path, columns=[origin, dest] + ([time_col] if time_col else [])).dropna()
+    ts = None
+    if time_col:
+        df = df.sort_values(time_col, kind="stable")
+        ts = pd.to_datetime(df[time_col]).to_numpy().astype("datetime64[ns]").astype(np.int64)
+    return df[origin].astype(int).to_numpy(), df[dest].astype(int).to_numpy(), ts
+
 def capsule_transition(args):
     if pd is None:
         raise RuntimeError("pandas/pyarrow required for 'transition' capsule")
-    df = pd.read_parquet(args.input, columns=[args.origin, args.dest])
-    pu = df[args.origin].astype("Int64").dropna().astype(int).to_numpy()
-    do = df[args.dest].astype("Int64").dropna().astype(int).to_numpy()
+    if args.window and not args.time_col:
+        raise RuntimeError("--window requires --time-col")
+    if args.nulls == "columns" and args.time_col:
+        raise RuntimeError("--nulls columns cannot be combined with --time-col")
+    pu, do, ts = INPUTS.get("od", args.input, (args.origin, args.dest, args.time_col, args.nulls),
+                            lambda: read_od(args.input, args.origin, args.dest, args.time_col, args.nulls))
     m = int(min(len(pu), len(do)))
     pu = pu[:m]; do = do[:m]
 
-    C = Counter(zip(pu, do))
-    rows = defaultdict(int)
-    for (i,j), c in C.items(): rows[i] += c
-    states = sorted(set(pu.tolist()) | set(do.tolist()))
-    idx = {s:k for k,s in enumerate(states)}
-    S = len(states)
-    P = np.zeros((S,S), dtype=np.float64)
-    for (i,j), c in C.items():
-        P[idx[i], idx[j]] += c / rows[i]
-
-    v = np.ones(S)/S
-    for _ in range(200): v = v @ P
-    pi = v / v.sum()
-
-    def H_row(p):
-        mask = p>0
-        return float(-np.sum(p[mask]*np.log2(p[mask])))
-    H_rate = float(sum(pi[i]*H_row(P[i]) for i in range(S)))
+    st = np.unique(np.concatenate([pu, do]))
+    S = len(st)
+    pu_idx, do_idx = np.searchsorted(st, pu), np.searchsorted(st, do)
+    C = np.bincount(pu_idx * S + do_idx, minlength=S*S).reshape(S, S)
+    H_rate = od_entropy_rate(C)
 
     lz_seq = do[::args.stride].tolist()
     lz_rate = lz78_bits_per_symbol(lz_seq, max_symbols=args.lz_cap)
 
+    keys, counts = context_count_table(pu_idx, do_idx, args.order, S)
+    H_cond = conditional_entropies(keys, counts, args.order, S)
+
+    windows = None
+    if args.window:
+        win_ns, step_ns = pd.Timedelta(args.window).value, pd.Timedelta(args.window_step).value
+        windows = windowed_rates(pu_idx, do_idx, ts, S, win_ns, step_ns, args.stride, args.lz_cap)
+
+    checkpoint = None
+    if args.checkpoint:
+        nz = np.flatnonzero(C)
+        checkpoint = write_checkpoint(args.checkpoint, "transition_markov",
+            {"order": args.order, "stride": args.stride, "lz_cap": args.lz_cap, "source": os.path.basename(args.input)},
+            states=st, od_flat=nz, od_counts=C.ravel()[nz], ctx_keys=keys, ctx_counts=counts,
+            lz78=np.array([lz_rate]), lz_symbols=np.array([min(len(lz_seq), args.lz_cap)]))
+
     manifest = {
         "capsule_id": "transition_markov",
         "source": os.path.basename(args.input),
-        "inputs": [{"path": args.input, "sha256": sha256_path(args.input)}],
+        "inputs": [{"path": args.input, "sha256": input_sha256(args.input)}],
         "parameters": {
             "origin_field": args.origin,
             "dest_field": args.dest,
-            "order": 1,
+            "order": args.order,
+            "null_policy": args.nulls,
             "stride": args.stride,
             "lz_cap": args.lz_cap
         },
@@ -97,59 +408,130 @@ def capsule_transition(args):
             "n_states": S,
             "entropy_rate_bits_per_step": H_rate,
             "lz78_bits_per_symbol": lz_rate,
-            "gap_bits_per_step": H_rate - lz_rate
+            "gap_bits_per_step": H_rate - lz_rate,
+            "conditional_entropy_bits": H_cond
         },
         "method": {
             "P": "empirical conditional D|P (counts normalized by origin)",
+            "nulls": ("trips with a null origin/dest (or time_col) dropped as whole rows" if args.nulls == "rows"
+                      else "nulls dropped per column, then truncated to the shorter column (legacy)"),
             "pi": "power iteration on P^T starting from uniform",
             "H_rate": "sum_i pi_i * H(P_i*) in base-2 bits",
-            "lz78": f"subsample stride={args.stride}, cap={args.lz_cap}"
+            "lz78": f"subsample stride={args.stride}, cap={args.lz_cap}",
+            "H_cond": "H(DO_t | last k of ...PU_{t-1},DO_{t-1},PU_t), empirical weights, packed int64 context keys, k=1..order; "
+                      "k counts interleaved PU/DO symbols, not trips (k=2j+1 spans the j previous trips)"
         },
         "created_at": now_iso()
     }
-    with open(args.out, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2)
-    print(f"[transition] pairs={m:,} states={S} H={H_rate:.4f} LZ={lz_rate:.4f}")
+    if args.time_col: manifest["parameters"]["time_col"] = args.time_col
+    if windows is not None:
+        manifest["parameters"].update(window=args.window, window_step=args.window_step)
+        manifest["metrics"]["windows"] = windows
+        manifest["method"]["windows"] = "per time window: incremental OD counts over active states, pi as in H_rate, warm-started from previous window (L1 tol 1e-10, <=200 iters; unconverged windows redone as 200 steps from uniform; H null when all mass leaks), LZ78 with same stride/cap; windows without trips are omitted"
+    if checkpoint: manifest["checkpoint"] = checkpoint
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2, allow_nan=False)
+    hk = " ".join(f"H{k}={v['bits']:.4f}" for k, v in H_cond.items())
+    print(f"[transition] pairs={m:,} states={S} H={H_rate:.4f} LZ={lz_rate:.4f} {hk}")
+    if windows:
+        Hw = [h for h in windows["entropy_rate_bits_per_step"] if h is not None]
+        print(f"[transition] windows={len(windows['window_start'])} ({args.window} every {args.window_step}) "
+              f"H range=[{min(Hw, default=0.0):.4f}, {max(Hw, default=0.0):.4f}]")
+
+def read_intervals(path, chrom, chrom_col=5, start_col=6, end_col=7):
+    """(starts, ends) int64 for one chromosome; UCSC rmsk columns by default (0-based)."""
+    starts, ends = [], []
+    with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+        for row in csv.reader(f, delimiter="\t"):
+            if not row or row[chrom_col] != chrom: continue
+            starts.append(int(row[start_col])); ends.append(int(row[end_col]))
+    return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+def window_coverage(starts, ends, win):
+    """
+    Covered bp per fixed window (intervals may overlap; overlaps count twice).
+    Returns (window indices with coverage > 0, coverage_bp), both int64.
+    """
+    keep = ends > starts
+    s, e = starts[keep], ends[keep]
+    if not len(s):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    w0, w1 = s // win, (e - 1) // win
+    n = int(w1.max()) + 1
+    one = w0 == w1
+    cov = np.bincount(w0[one], weights=(e - s)[one], minlength=n)
+    span = ~one
+    cov += np.bincount(w0[span], weights=((w0 + 1) * win - s)[span], minlength=n)
+    cov += np.bincount(w1[span], weights=(e - w1 * win)[span], minlength=n)
+    inner = np.zeros(n + 1, dtype=np.int64)     # fully covered windows strictly between w0 and w1
+    np.add.at(inner, w0[span] + 1, 1); np.add.at(inner, w1[span], -1)
+    cov = np.rint(cov).astype(np.int64) + np.cumsum(inner[:n]) * win
+    windows = np.flatnonzero(cov)
+    return windows, cov[windows]
+
+def parse_bp(x) -> int:
+    # "5000", "5k", "1M" -> bp
+    x = str(x).strip(); mult = {"k": 1_000, "m": 1_000_000}.get(x[-1:].lower(), 1)
+    return int(float(x[:-1] if mult > 1 else x) * mult)
+
+def sweep_scales(spec, base, top=1_000_000):
+    """Window sizes for --win-sweep: a comma list, or (spec 'auto') the 1-2-5 series base..top."""
+    if spec == "auto":
+        sizes, dec = [], base
+        while dec <= top:
+            sizes += [m * dec for m in (1, 2, 5) if m * dec <= top]; dec *= 10
+    else:
+        sizes = sorted({parse_bp(x) for x in spec.split(",") if x.strip()})
+    bad = [w for w in sizes if w < base or w % base]
+    if bad:
+        raise RuntimeError(f"--win-sweep sizes must be multiples of --sweep-base {base}: {bad}")
+    return sizes
+
+SWEEP_COLUMNS = ["window_bp", "n_windows", "bmo_16", "bmo_32", "bmo_64", "bmo_star", "alpha_star", "ceiling_proxy"]
+
+def coverage_sweep(starts, ends, base, sizes) -> dict:
+    """
+    One coverage pass at `base` bp, then every coarser window W = k*base as differences
+    of the base prefix sum at group edges. Coverage is additive over the base windows, so
+    each row equals a direct --win W run.
+    """
+    idx, bp = window_coverage(starts, ends, base)
+    dense = np.zeros(int(idx[-1]) + 1 if len(idx) else 0, dtype=np.int64); dense[idx] = bp
+    P = np.concatenate([[0], np.cumsum(dense)])
+    rows = []
+    for W in sizes:
+        k = W // base
+        edges = np.minimum(np.arange(0, len(dense) + k, k), len(dense))
+        cov = P[edges[1:]] - P[edges[:-1]]
+        cov = cov[cov > 0]
+        m = bmo_metrics((cov / W).tolist())
+        jn = m["john_nirenberg"]
+        rows.append([W, m["n_windows"], m["bmo_16"], m["bmo_32"], m["bmo_64"], m["bmo_star"],
+                     jn["alpha_star"], jn["ceiling_proxy"]])
+    return {"base_bp": base, "columns": SWEEP_COLUMNS, "rows": rows}
 
 def capsule_interval_bmo(args):
     chrom = args.chrom
     win = args.win
-    cov = defaultdict(int)
-    with gzip.open(args.input, "rt", encoding="utf-8", errors="replace") as f:
-        rdr = csv.reader(f, delimiter="\t")
-        for row in rdr:
-            if not row: continue
-            # UCSC rmsk format by default: chrom at col 5 (0-based), start 6, end 7
-            c = row[args.chrom_col]
-            if c != chrom: continue
-            start = int(row[args.start_col]); end = int(row[args.end_col])
-            w0 = start // win; w1 = (end-1) // win
-            for w in range(w0, w1+1):
-                s = max(start, w*win); e = min(end, (w+1)*win)
-                if e> s: cov[w] += (e - s)
-    windows = sorted(cov.keys())
-    dens = [cov[w]/win for w in windows]
-
-    def bmo(vals, block):
-        n=len(vals); best=0.0
-        for i in range(0, n):
-            j = min(n, i+block)
-            if j<=i: continue
-            Q = vals[i:j]
-            mean = sum(Q)/len(Q)
-            osc = sum(abs(x-mean) for x in Q)/len(Q)
-            if osc>best: best=osc
-        return best
-
-    bmo16, bmo32, bmo64 = bmo(dens,16), bmo(dens,32), bmo(dens,64)
-    bmo_star = max(bmo16, bmo32, bmo64)
-    c1, c2 = 2.0, 0.5
-    alpha_star = c2 / max(1e-12, bmo_star)
-    ceiling = c1 * math.exp(-c2 / max(1e-12, bmo_star))
+    starts, ends = INPUTS.get("intervals", args.input, (chrom, args.chrom_col, args.start_col, args.end_col),
+                              lambda: read_intervals(args.input, chrom, args.chrom_col, args.start_col, args.end_col))
+    windows, cov_bp = window_coverage(starts, ends, win)
+    dens = [c/win for c in cov_bp.tolist()]
+    windows = windows.tolist()
+    metrics = bmo_metrics(dens)
+    sizes = sweep_scales(args.win_sweep, args.sweep_base) if args.win_sweep else None
+    if sizes:
+        metrics["win_sweep"] = coverage_sweep(starts, ends, args.sweep_base, sizes)
+
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = write_checkpoint(args.checkpoint, "interval_bmo_chr",
+            {"chrom": chrom, "window": win, "source": os.path.basename(args.input)},
+            windows=np.array(windows, dtype=np.int64), coverage_bp=cov_bp)
 
     manifest = {
         "capsule_id": "interval_bmo_chr",
         "source": os.path.basename(args.input),
-        "inputs": [{"path": args.input, "sha256": sha256_path(args.input)}],
+        "inputs": [{"path": args.input, "sha256": input_sha256(args.input)}],
         "parameters": {
             "chrom": chrom,
             "window": win,
@@ -158,67 +540,294 @@ def capsule_interval_bmo(args):
             "end_col": args.end_col
         },
         "random_state": {},
-        "metrics": {
-            "n_windows": len(windows),
-            "bmo_16": bmo16,
-            "bmo_32": bmo32,
-            "bmo_64": bmo64,
-            "bmo_star": bmo_star,
-            "john_nirenberg": {
-                "c1": c1, "c2": c2,
-                "alpha_star": alpha_star,
-                "ceiling_proxy": ceiling
-            }
-        },
+        "metrics": metrics,
         "method": {
             "coverage": "windowed bp/Win for intervals",
             "BMO": "max avg deviation over blocks {16,32,64}"
         },
         "created_at": now_iso()
     }
-    with open(args.out, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2)
-    print(f"[interval-bmo] {chrom} windows={len(windows)} BMO*={bmo_star:.6f}")
+    if sizes:
+        manifest["parameters"].update(win_sweep=sizes, sweep_base=args.sweep_base)
+        manifest["method"]["win_sweep"] = "one coverage pass at sweep_base bp; window W = base prefix-sum differences every W/base windows; BMO* and JN ceiling per W (rows follow columns)"
+    if checkpoint: manifest["checkpoint"] = checkpoint
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2, allow_nan=False)
+    print(f"[interval-bmo] {chrom} windows={len(windows)} BMO*={metrics['bmo_star']:.6f}")
+    for row in (metrics["win_sweep"]["rows"] if sizes else []):
+        print(f"[interval-bmo]   W={row[0]:>9,} windows={row[1]:>7,} BMO*={row[5]:.6f} ceiling={row[7]:.4e}")
+
+def read_edges(path) -> np.ndarray:
+    """SNAP-style edge list (gzip ok, '#' comments) -> int64 array of shape (E, 2)."""
+    return np.loadtxt(path, dtype=np.int64, comments="#", ndmin=2).reshape(-1, 2)
+
+def cached_edges(path) -> np.ndarray:
+    return INPUTS.get("edges", path, (), lambda: read_edges(path))
+
+def nx_graph(edges, directed):
+    """Undirected networkx view of a SNAP edge list, nodes in first-appearance order."""
+    Gd = nx.DiGraph(); Gd.add_edges_from(map(tuple, edges.tolist()))
+    return nx.Graph(Gd) if not directed else Gd.to_undirected()
+
+def sparse_adjacency(edges):
+    """Undirected 0/1 CSR adjacency over the distinct node ids in `edges`."""
+    nodes, inv = np.unique(edges, return_inverse=True)
+    inv = inv.reshape(-1, 2); n = len(nodes)
+    A = sps.coo_matrix((np.ones(len(inv)), (inv[:,0], inv[:,1])), shape=(n, n)).tocsr()
+    A = A + A.T
+    A.data[:] = 1.0
+    A.eliminate_zeros()
+    return A, nodes
+
+def slq_quadrature(A, n_probes, m, seed, batch=8):
+    """
+    Stochastic Lanczos quadrature: m Lanczos steps from each Rademacher probe, run
+    `batch` probes at a time. Returns Ritz nodes and weights, each (n_probes, m);
+    n * sum_j w_j f(theta_j) is an unbiased-probe estimate of Tr f(A).
+    """
+    n = A.shape[0]; rng = np.random.default_rng(seed)
+    nodes, weights = [], []
+    for b0 in range(0, n_probes, batch):
+        P = min(batch, n_probes - b0)
+        V = rng.choice([-1.0, 1.0], size=(n, P)) / math.sqrt(n)
+        V_prev = np.zeros_like(V); beta = np.zeros(P)
+        alphas, betas = [], []
+        for _ in range(m):
+            W = A @ V
+            alpha = np.einsum("ij,ij->j", W, V)
+            W -= V * alpha; W -= V_prev * beta
+            beta = np.linalg.norm(W, axis=0)
+            alphas.append(alpha); betas.append(beta)
+            ok = beta > 1e-10   # invariant subspace reached: the rest of T decouples with zero weight
+            V_prev = V
+            V = np.where(ok, W / np.where(ok, beta, 1.0), 0.0)
+        alphas = np.array(alphas).T; betas = np.array(betas).T
+        for p in range(P):
+            T = np.diag(alphas[p]) + np.diag(betas[p,:-1], 1) + np.diag(betas[p,:-1], -1)
+            theta, U = np.linalg.eigh(T)
+            nodes.append(theta); weights.append(U[0]**2)
+    return np.array(nodes), np.array(weights)
+
+def graph_spectral_slq(args):
+    if sps is None:
+        raise RuntimeError("scipy required for 'graph --spectral slq'")
+    A, _ = INPUTS.get("adjacency", args.input, (), lambda: sparse_adjacency(cached_edges(args.input)))
+    n = A.shape[0]; m = int((A.nnz + A.diagonal().sum()) // 2)
+
+    k_top = min(args.top_k, max(1, n - 2))
+    v0 = np.random.default_rng(args.seed).uniform(-1.0, 1.0, n)   # ARPACK otherwise starts from an unseeded random vector
+    lam_top = np.sort(eigsh(A, k=k_top, which="LA", v0=v0, return_eigenvectors=False))[::-1]
+    lam_bot = np.sort(eigsh(A, k=k_top, which="SA", v0=v0, return_eigenvectors=False))
+
+    theta, w = slq_quadrature(A, args.probes, args.lanczos, args.seed)
+    P = len(theta)
+    moments = {}
+    for k in range(1, args.k_max+1):
+        per_probe = n * np.sum(w * theta**k, axis=1)
+        moments[str(k)] = {"estimate": float(per_probe.mean()),
+                           "stderr": float(per_probe.std(ddof=1) / math.sqrt(P)) if P > 1 else None}
+    # cheap exact checks: Tr A, Tr A^2 = sum of squared entries, Tr A^3 = <A@A, A>
+    exact = {"1": float(A.diagonal().sum()), "2": float(A.multiply(A).sum())}
+    if args.k_max >= 3: exact["3"] = float((A @ A).multiply(A).sum())
+    z = [abs(moments[k]["estimate"] - v) / moments[k]["stderr"]
+         for k, v in exact.items() if k in moments and moments[k]["stderr"]]
+
+    lo, hi = float(lam_bot[0]), float(lam_top[0])
+    edges_ = np.linspace(lo, hi, args.bins + 1); width = edges_[1] - edges_[0]
+    # converged extreme Ritz values sit on the edges to within rounding; clip so they land in the end bins
+    theta_in = np.clip(theta, lo, hi)
+    hist = np.stack([np.histogram(theta_in[p], bins=edges_, weights=w[p])[0] for p in range(P)])
+    dens = hist.mean(axis=0) / width
+    dens_err = (hist.std(axis=0, ddof=1) / math.sqrt(P) / width) if P > 1 else np.zeros(args.bins)
+
+    manifest = {
+        "capsule_id": "graph_spectral_slq",
+        "source": os.path.basename(args.input),
+        "inputs": [{"path": args.input, "sha256": input_sha256(args.input)}],
+        "parameters": {
+            "directed": bool(args.directed),
+            "k_max": args.k_max,
+            "probes": args.probes,
+            "lanczos_steps": args.lanczos,
+            "top_k": k_top,
+            "bins": args.bins,
+            "seed": args.seed
+        },
+        "random_state": {"probe_rng": "numpy default_rng(seed), Rademacher"},
+        "metrics": {
+            "n_nodes": n,
+            "n_edges": m,
+            "lambda_top": lam_top.tolist(),
+            "lambda_bottom": lam_bot.tolist(),
+            "moments_trace_estimate": moments,
+            "moments_exact": exact,
+            "moments_max_abs_z": max(z) if z else None,
+            "density": {"bin_edges": edges_.tolist(), "rho": dens.tolist(), "rho_stderr": dens_err.tolist()}
+        },
+        "method": {
+            "A": "undirected 0/1 sparse adjacency of the full graph",
+            "moments": "SLQ: Tr(A^k) ~ n * mean_probe sum_j w_j theta_j^k, stderr over probes",
+            "density": "probe-averaged Ritz weights histogrammed on [lambda_min, lambda_max] (Ritz values clipped into range)",
+            "extremes": "ARPACK eigsh, which=LA/SA, v0 from default_rng(seed)"
+        },
+        "created_at": now_iso()
+    }
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2, allow_nan=False)
+    print(f"[graph-slq] n={n} m={m} λ_max={hi:.4f} λ_min={lo:.4f} probes={P} max z={max(z) if z else 0.0:.2f}")
+
+def trace_spectrum_diffs(A, k_max):
+    evals = np.linalg.eigvalsh(A)
+    diffs = []
+    for k in range(1, k_max+1):
+        trace_pow = float(np.trace(np.linalg.matrix_power(A, k)))
+        spectral = float(np.sum(evals**k))
+        diffs.append(abs(trace_pow - spectral))
+    return diffs
+
+def csr_adjacency(edges):
+    """
+    Undirected CSR (indptr, indices) in plain numpy. Nodes are ordered by first
+    appearance in the edge list, which is the order nx.DiGraph(edges) iterates them,
+    so random.sample over positions reproduces the single-seed sample exactly.
+    """
+    uniq, first, inv = np.unique(edges.ravel(), return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(uniq), dtype=np.int64); rank[order] = np.arange(len(uniq))
+    e = rank[inv].reshape(-1, 2)
+    pairs = np.unique(np.concatenate([e, e[:, ::-1]]), axis=0)
+    indptr = np.zeros(len(uniq) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pairs[:, 0], minlength=len(uniq)), out=indptr[1:])
+    return uniq[order], indptr, pairs[:, 1].copy()
+
+def parse_seeds(spec):
+    # "0..99" (inclusive) or "1,5,7"
+    if ".." in spec:
+        a, b = spec.split("..")
+        return list(range(int(a), int(b) + 1))
+    return [int(x) for x in spec.split(",") if x.strip()]
+
+_ENS = {}   # per-process adjacency for pool workers only; the serial path passes arrays explicitly
+
+def _ensemble_init(tmpdir):
+    # adjacency is shared read-only: every worker memory-maps the same .npy files
+    for k in ("nodes", "indptr", "indices"):
+        _ENS[k] = np.load(os.path.join(tmpdir, k + ".npy"), mmap_mode="r")
+
+def _ensemble_sample(job, arrays=None):
+    seed, n_max, k_max = job
+    arrays = _ENS if arrays is None else arrays
+    indptr, indices = arrays["indptr"], arrays["indices"]
+    n_all = len(indptr) - 1
+    idx = random.Random(seed).sample(range(n_all), n_max) if n_max and n_all > n_max else list(range(n_all))
+    pos = np.full(n_all, -1, dtype=np.int64); pos[idx] = np.arange(len(idx))
+    A = np.zeros((len(idx), len(idx)))
+    for r, i in enumerate(idx):
+        p = pos[indices[indptr[i]:indptr[i+1]]]
+        A[r, p[p >= 0]] = 1.0
+    m = int((np.count_nonzero(A) + np.count_nonzero(np.diag(A))) // 2)
+    diffs = trace_spectrum_diffs(A, k_max)
+    return seed, np.asarray(arrays["nodes"][idx], dtype=np.int64), m, max(diffs) if diffs else 0.0
+
+def _ensemble_sample_in(job):
+    # shared-pool variant: each job names the adjacency directory it belongs to
+    tmpdir, j = job
+    if _ENS.get("dir") != tmpdir:
+        _ensemble_init(tmpdir); _ENS["dir"] = tmpdir
+    return _ensemble_sample(j)
+
+SHARED_POOL = None   # set by 'serve'
+
+def graph_ensemble(args):
+    seeds = parse_seeds(args.seeds)
+    nodes, indptr, indices = INPUTS.get("csr", args.input, (), lambda: csr_adjacency(cached_edges(args.input)))
+    jobs = [(s, args.n_max, args.k_max) for s in seeds]
+    if args.workers > 1 and len(jobs) > 1:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for k, v in (("nodes", nodes), ("indptr", indptr), ("indices", indices)):
+                np.save(os.path.join(tmpdir, k + ".npy"), v)
+            if SHARED_POOL is not None:   # serve mode: one long-lived pool shared by all requests
+                results = list(SHARED_POOL.map(_ensemble_sample_in, [(tmpdir, j) for j in jobs]))
+            else:
+                with ProcessPoolExecutor(max_workers=args.workers, initializer=_ensemble_init,
+                                         initargs=(tmpdir,)) as ex:
+                    results = list(ex.map(_ensemble_sample, jobs, chunksize=max(1, len(jobs) // (4*args.workers))))
+    else:
+        arrays = {"nodes": nodes, "indptr": indptr, "indices": indices}
+        results = [_ensemble_sample(j, arrays) for j in jobs]
+
+    gaps = np.array([r[3] for r in results])
+    samples = np.stack([r[1] for r in results]).astype(np.int32 if nodes.max(initial=0) < 2**31 else np.int64)
+    worst = int(np.argmax(gaps))
+    loops = int(np.count_nonzero(np.repeat(np.arange(len(nodes)), np.diff(indptr)) == indices))
+    q = np.quantile(gaps, [0.05, 0.25, 0.5, 0.75, 0.95])
+
+    manifest = {
+        "capsule_id": "graph_trace_ensemble",
+        "source": os.path.basename(args.input),
+        "inputs": [{"path": args.input, "sha256": input_sha256(args.input)}],
+        "parameters": {
+            "directed": bool(args.directed),
+            "n_max": args.n_max,
+            "k_max": args.k_max,
+            "seeds": args.seeds
+        },
+        "random_state": {
+            "seeds": seeds,
+            "sampled_nodes": sidecar_array(samples, args.out)
+        },
+        "metrics": {
+            "n_all_nodes": int(len(nodes)),
+            "n_all_edges": (len(indices) + loops) // 2,
+            "n_samples": len(seeds),
+            "n_nodes": int(samples.shape[1]),
+            "n_edges_mean": float(np.mean([r[2] for r in results])),
+            "gap_mean": float(gaps.mean()),
+            "gap_quantiles": {"q05": float(q[0]), "q25": float(q[1]), "q50": float(q[2]), "q75": float(q[3]), "q95": float(q[4])},
+            "gap_worst": float(gaps[worst]),
+            "gap_worst_seed": int(seeds[worst]),
+            "k_tested": list(range(1, args.k_max+1))
+        },
+        "method": {
+            "A": "undirected adjacency of each seed's sampled induced subgraph (random.Random(seed).sample)",
+            "test": "per seed max_k |Tr(A^k) - sum(lambda^k)|; mean/quantiles/worst over seeds",
+            "sharing": "CSR adjacency memory-mapped read-only by pool workers"
+        },
+        "created_at": now_iso()
+    }
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2, allow_nan=False)
+    print(f"[graph-ensemble] seeds={len(seeds)} n={samples.shape[1]} mean|Δ|={gaps.mean():.3e} "
+          f"q95={q[4]:.3e} worst={gaps[worst]:.3e} (seed {seeds[worst]})")
 
 def capsule_graph(args):
+    if args.spectral == "slq":
+        return graph_spectral_slq(args)
+    if args.seeds:
+        return graph_ensemble(args)
     if nx is None:
         raise RuntimeError("networkx/numpy required for 'graph' capsule")
-    edges = []
-    with gzip.open(args.input, "rt", encoding="utf-8", errors="replace") as f:
-        for line in f:
-            if not line or line.startswith("#"): continue
-            a,b = line.strip().split()
-            edges.append((int(a), int(b)))
-    Gd = nx.DiGraph(); Gd.add_edges_from(edges)
-    H = nx.Graph(Gd) if not args.directed else Gd.to_undirected()
+    H = INPUTS.get("nx", args.input, (bool(args.directed),), lambda: nx_graph(cached_edges(args.input), args.directed))
     n_all = H.number_of_nodes(); m_all = H.number_of_edges()
     nodes = list(H.nodes())
     sampled_nodes: List[int]
     if args.n_max and n_all > args.n_max:
-        random.seed(args.seed)
-        sampled_nodes = random.sample(nodes, args.n_max)
+        sampled_nodes = random.Random(args.seed).sample(nodes, args.n_max)   # same stream as random.seed(seed)
         H = H.subgraph(sampled_nodes).copy()
     else:
         sampled_nodes = nodes
     n = H.number_of_nodes(); m = H.number_of_edges()
     A = nx.to_numpy_array(H, dtype=float)
-    evals = np.linalg.eigvalsh(A)
-    diffs = []
-    for k in range(1, args.k_max+1):
-        trace_pow = float(np.trace(np.linalg.matrix_power(A, k)))
-        spectral = float(np.sum(evals**k))
-        diffs.append(abs(trace_pow - spectral))
+    diffs = trace_spectrum_diffs(A, args.k_max)
 
     manifest = {
         "capsule_id": "graph_trace",
         "source": os.path.basename(args.input),
-        "inputs": [{"path": args.input, "sha256": sha256_path(args.input)}],
+        "inputs": [{"path": args.input, "sha256": input_sha256(args.input)}],
         "parameters": {
             "directed": bool(args.directed),
             "n_max": args.n_max,
             "k_max": args.k_max,
             "seed": args.seed
         },
-        "random_state": {"sampled_nodes": sampled_nodes},
+        "random_state": {"sampled_nodes": sidecar_array(np.asarray(sampled_nodes, dtype=np.int64), args.out)},
         "metrics": {
             "n_nodes": n,
             "n_edges": m,
@@ -231,9 +840,224 @@ def capsule_graph(args):
         },
         "created_at": now_iso()
     }
-    with open(args.out, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2)
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2, allow_nan=False)
     print(f"[graph] n={n} m={m} max|Δ|={max(diffs) if diffs else 0.0:.3e}")
 
+# ---------- merge ----------
+def resolve_checkpoint(p):
+    """A checkpoint path, or a manifest whose "checkpoint" reference is followed and hash-checked."""
+    if not p.endswith(".json"):
+        return p, sha256_path(p)
+    with open(p, "rb") as f: ref = json.load(f).get("checkpoint")
+    if not ref:
+        raise RuntimeError(f"{p}: manifest has no checkpoint")
+    cp = ref["path"] if os.path.isabs(ref["path"]) or os.path.exists(ref["path"]) \
+        else os.path.join(os.path.dirname(p), os.path.basename(ref["path"]))
+    got = sha256_path(cp)
+    if got != ref["sha256"]:
+        raise RuntimeError(f"{cp}: sha256 {got} != manifest {ref['sha256']}")
+    return cp, got
+
+def remap_context_keys(keys, old_states, new_states, order):
+    """Re-pack base-|old| context keys into base-|new| keys, keeping the last `order` context symbols."""
+    So, Sn = len(old_states), len(new_states)
+    pos = np.searchsorted(new_states, old_states)
+    out = np.zeros(len(keys), dtype=np.int64)
+    for j in range(order+1):
+        out += pos[(keys // So**j) % So] * Sn**j
+    return out
+
+def merge_transition(parts):
+    st = np.unique(np.concatenate([a["states"] for _, a in parts]))
+    S = len(st); order = min(h["order"] for h, _ in parts)
+    if S ** (order+1) >= 2**63:
+        raise ValueError(f"order {order} with {S} states does not fit a 64-bit context key")
+    C = np.zeros(S*S, dtype=np.int64); keys, counts = [], []
+    for h, a in parts:
+        So = len(a["states"]); pos = np.searchsorted(st, a["states"])
+        i, j = np.divmod(a["od_flat"], So)
+        np.add.at(C, pos[i]*S + pos[j], a["od_counts"])
+        keys.append(remap_context_keys(a["ctx_keys"], a["states"], st, order)); counts.append(a["ctx_counts"])
+    keys, inv = np.unique(np.concatenate(keys), return_inverse=True)
+    counts = np.bincount(inv.ravel(), weights=np.concatenate(counts)).astype(np.int64)
+    C = C.reshape(S, S)
+    H_rate = od_entropy_rate(C)
+    w = np.array([a["lz_symbols"][0] for _, a in parts], dtype=np.float64)
+    lz = float(np.dot(w, [a["lz78"][0] for _, a in parts]) / max(1.0, w.sum()))
+    metrics = {
+        "n_pairs": int(C.sum()),
+        "n_states": S,
+        "entropy_rate_bits_per_step": H_rate,
+        "lz78_bits_per_symbol": lz,
+        "gap_bits_per_step": H_rate - lz,
+        "conditional_entropy_bits": conditional_entropies(keys, counts, order, S)
+    }
+    method = {
+        "P": "empirical conditional D|P from summed monthly OD counts",
+        "pi": "power iteration on P^T starting from uniform",
+        "H_rate": "sum_i pi_i * H(P_i*) in base-2 bits",
+        "lz78": "symbol-weighted mean of per-part LZ78 rates (LZ78 state is not mergeable)",
+        "H_cond": f"summed context tables re-keyed to the merged state set, k=1..{order}; contexts spanning part boundaries are absent"
+    }
+    return {"order": order}, metrics, method
+
+def merge_interval(parts):
+    h0 = parts[0][0]
+    for h, _ in parts:
+        if (h["chrom"], h["window"]) != (h0["chrom"], h0["window"]):
+            raise RuntimeError("interval checkpoints must share chrom and window")
+    windows, inv = np.unique(np.concatenate([a["windows"] for _, a in parts]), return_inverse=True)
+    cov = np.bincount(inv.ravel(), weights=np.concatenate([a["coverage_bp"] for _, a in parts])).astype(np.int64)
+    dens = [int(c)/h0["window"] for c in cov]
+    method = {"coverage": "summed per-window bp from part checkpoints, /Win",
+              "BMO": "max avg deviation over blocks {16,32,64}"}
+    return {"chrom": h0["chrom"], "window": h0["window"]}, bmo_metrics(dens), method
+
+MERGERS = {"transition_markov": merge_transition, "interval_bmo_chr": merge_interval}
+
+def capsule_merge(args):
+    refs = [resolve_checkpoint(p) for p in args.checkpoints]
+    parts = [read_checkpoint(cp) for cp, _ in refs]
+    kinds = {h["kind"] for h, _ in parts}
+    if len(kinds) != 1 or next(iter(kinds)) not in MERGERS:
+        raise RuntimeError(f"cannot merge checkpoint kinds {sorted(kinds)}")
+    kind = kinds.pop()
+    params, metrics, method = MERGERS[kind](parts)
+    sources = [h.get("source") for h, _ in parts]
+    manifest = {
+        "capsule_id": kind,
+        "source": "+".join(s for s in sources if s),
+        "inputs": [{"path": cp, "sha256": h} for cp, h in refs],
+        "parameters": {**params, "merged_parts": len(parts)},
+        "random_state": {},
+        "metrics": metrics,
+        "method": method,
+        "created_at": now_iso()
+    }
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2, allow_nan=False)
+    print(f"[merge] {kind} parts={len(parts)} → {args.out}")
+
+# ---------- serve ----------
+def inline_sidecars(obj, manifest_path):
+    if isinstance(obj, dict):
+        if obj.get("sidecar") == "npy":
+            return load_array(obj, manifest_path).tolist()
+        return {k: inline_sidecars(v, manifest_path) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [inline_sidecars(v, manifest_path) for v in obj]
+    return obj
+
+def run_request(argv) -> dict:
+    """
+    One capsule run inside the server: argv as for the CLI, minus --out/--checkpoint.
+    The manifest goes to a server-owned temp file and comes back with sidecar arrays
+    inlined; requests cannot choose where anything is written.
+    """
+    argv = [str(a) for a in argv]
+    if not argv or argv[0] not in ("transition", "interval-bmo", "graph", "merge"):
+        raise ValueError("expected a capsule subcommand (transition, interval-bmo, graph, merge)")
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "manifest.json")
+        try:
+            # our --out goes first: a caller's --out (or any abbreviation of it) would override it
+            args = build_parser().parse_args([argv[0], "--out", out] + argv[1:])
+        except SystemExit:
+            raise ValueError("bad arguments: " + " ".join(argv))
+        if args.out != out or getattr(args, "checkpoint", None):
+            raise ValueError("--out and --checkpoint are not accepted by the server")
+        t0 = time.perf_counter()
+        args.func(args)
+        ms = (time.perf_counter() - t0) * 1e3
+        with open(out, "rb") as f: manifest = json.load(f)
+        manifest = inline_sidecars(manifest, out)
+    return {"manifest": manifest, "elapsed_ms": round(ms, 3)}
+
+def capsule_serve(args):
+    import http.server, socketserver
+    try:
+        import pyarrow.parquet  # noqa: F401  (pandas imports its parquet engine lazily; pay that once here)
+    except Exception:
+        pass
+    global SHARED_POOL
+    INPUTS.max_bytes = args.cache_mb << 20
+    slots = threading.BoundedSemaphore(args.jobs)
+    token = os.environ.get("HARSH_SERVE_TOKEN") or secrets.token_urlsafe(24)
+    hosts = {"localhost", "127.0.0.1", "[::1]"}
+    # spawn, not fork: workers must not inherit the threaded server's locks
+    SHARED_POOL = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def reply(self, code, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers(); self.wfile.write(body)
+
+        def refused(self):
+            """403 unless Host is loopback and the start-up token is presented (blocks CSRF / DNS rebinding)."""
+            host = (self.headers.get("Host") or "").strip().lower()
+            host = host.rsplit(":", 1)[0] if not host.endswith("]") else host
+            auth = self.headers.get("Authorization", "")
+            if host not in hosts or not secrets.compare_digest(auth, f"Bearer {token}"):
+                self.reply(403, {"error": "forbidden: loopback Host and 'Authorization: Bearer <token>' required"})
+                return True
+            return False
+
+        def do_GET(self):
+            if self.refused(): return
+            if self.path.rstrip("/") == "/stats": self.reply(200, INPUTS.stats())
+            else: self.reply(404, {"error": "GET /stats or POST /run"})
+
+        def do_POST(self):
+            if self.refused(): return
+            if self.path.rstrip("/") != "/run":
+                return self.reply(404, {"error": "GET /stats or POST /run"})
+            if (self.headers.get("Content-Type") or "").split(";")[0].strip().lower() != "application/json":
+                return self.reply(415, {"error": "Content-Type must be application/json"})
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                argv = req.get("argv") if isinstance(req, dict) else req
+                with slots:
+                    res = run_request(argv or [])
+                res["cache"] = {k: v for k, v in INPUTS.stats().items() if k != "keys"}
+                self.reply(200, res)
+            except ValueError as e:
+                self.reply(400, {"error": str(e)})
+            except Exception as e:
+                self.reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def address_string(self):
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def stale_socket(path):
+        try: return stat.S_ISSOCK(os.lstat(path).st_mode)
+        except FileNotFoundError: return False
+
+    if args.socket:
+        if stale_socket(args.socket): os.remove(args.socket)
+        elif os.path.lexists(args.socket):
+            raise RuntimeError(f"{args.socket} exists and is not a socket")
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+        srv = Server(args.socket, Handler); where = f"unix:{args.socket}"
+    else:
+        srv = http.server.ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+        where = f"http://127.0.0.1:{srv.server_address[1]}"
+    print(f"[serve] {where} jobs={args.jobs} cache={args.cache_mb} MB  (POST /run {{\"argv\": [...]}}, GET /stats)",
+          flush=True)
+    print(f"[serve] token: {token}  (send 'Authorization: Bearer <token>'; fix it with HARSH_SERVE_TOKEN)", flush=True)
+    def interrupt(signum, frame): raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, interrupt)   # 'kill' shuts down the shared pool too, not just Ctrl-C
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        SHARED_POOL.shutdown(cancel_futures=True); SHARED_POOL = None
+        if args.socket and stale_socket(args.socket): os.remove(args.socket)
+
 # ---------- CLI ----------
 def build_parser():
     p = argparse.ArgumentParser(prog="capsules_cli", description="Generalized capsules → JSON manifests")
@@ -245,6 +1069,15 @@ def build_parser():
     t.add_argument("--dest", required=True)
     t.add_argument("--stride", type=int, default=int(os.environ.get("HARSH_TAXI_STRIDE","5")))
     t.add_argument("--lz-cap", type=int, default=int(os.environ.get("HARSH_LZ_MAX","500000")))
+    t.add_argument("--order", type=int, default=1,
+                   help="max context order K for conditional entropies, counted in interleaved PU/DO symbols "
+                        "(1 = current pickup, 3 = previous trip + current pickup)")
+    t.add_argument("--time-col", default=None, help="sort trips by this column first (e.g. tpep_pickup_datetime)")
+    t.add_argument("--nulls", choices=["rows", "columns"], default="rows",
+                   help="rows: drop trips with any null field; columns: legacy per-column drop (no --time-col)")
+    t.add_argument("--window", default=None, help="sliding time window, e.g. 1h (needs --time-col)")
+    t.add_argument("--window-step", default="1D", help="window start stride, e.g. 1D")
+    t.add_argument("--checkpoint", default=None, help="write mergeable OD/context counts to this .npz")
     t.add_argument("--out", required=True)
     t.set_defaults(func=capsule_transition)
 
@@ -255,6 +1088,10 @@ def build_parser():
     b.add_argument("--chrom-col", type=int, default=5)
     b.add_argument("--start-col", type=int, default=6)
     b.add_argument("--end-col", type=int, default=7)
+    b.add_argument("--win-sweep", nargs="?", const="auto", default=None,
+                   help="also tabulate BMO* over window sizes: '2k,5k,1M' or bare for the 1-2-5 series up to 1 Mb")
+    b.add_argument("--sweep-base", type=parse_bp, default=1000, help="base coverage resolution for --win-sweep (bp)")
+    b.add_argument("--checkpoint", default=None, help="write mergeable per-window coverage to this .npz")
     b.add_argument("--out", required=True)
     b.set_defaults(func=capsule_interval_bmo)
 
@@ -264,9 +1101,29 @@ def build_parser():
     g.add_argument("--n-max", type=int, default=int(os.environ.get("HARSH_GRAPH_N","400")))
     g.add_argument("--k-max", type=int, default=int(os.environ.get("HARSH_GRAPH_KMAX","6")))
     g.add_argument("--seed", type=int, default=0)
+    g.add_argument("--spectral", choices=["sample", "slq"], default="sample",
+                   help="sample: exact eigvalsh on an induced subgraph; slq: full-graph Lanczos quadrature")
+    g.add_argument("--probes", type=int, default=32)
+    g.add_argument("--lanczos", type=int, default=64)
+    g.add_argument("--top-k", type=int, default=10)
+    g.add_argument("--bins", type=int, default=100)
+    g.add_argument("--seeds", default=None, help="ensemble mode: '0..N' (inclusive) or '1,5,7'")
+    g.add_argument("--workers", type=int, default=os.cpu_count() or 1)
     g.add_argument("--out", required=True)
     g.set_defaults(func=capsule_graph)
 
+    mg = sp.add_parser("merge", help="Combine capsule checkpoints (e.g. monthly) into one manifest")
+    mg.add_argument("checkpoints", nargs="+", help="checkpoint .npz files or manifests referencing them")
+    mg.add_argument("--out", required=True)
+    mg.set_defaults(func=capsule_merge)
+
+    sv = sp.add_parser("serve", help="Long-running server: warm imports + LRU cache of parsed inputs")
+    sv.add_argument("--port", type=int, default=int(os.environ.get("HARSH_SERVE_PORT", "8765")), help="localhost HTTP port")
+    sv.add_argument("--socket", default=None, help="listen on this Unix socket instead of localhost HTTP")
+    sv.add_argument("--cache-mb", type=int, default=int(os.environ.get("HARSH_CACHE_MB", "2048")))
+    sv.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="capsule runs in flight at once")
+    sv.set_defaults(func=capsule_serve)
+
     return p
 
 def main():
@@ -0,0 +1,222 @@
+﻿import argparse, csv, fnmatch, io, json, os, sys, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+
+# Metadata-only structural claims for datasets/out/<slug>/{data.parquet|data.csv, manifest.json}.
+# Row counts and column names come from the Parquet footer or a newline scan of the CSV,
+# never from parsing values, so a whole catalog checks in seconds.
+
+# dataset glob -> rules; every matching pattern contributes, later rules with the same claim name win
+DEFAULT_RULES = {
+    "*": [
+        {"check": "manifest_has_sha256"},
+        {"check": "nrows_gt", "value": 0},
+        {"check": "columns_gt", "value": 0},
+        {"check": "no_duplicate_columns"},
+    ],
+    "tlc_yellow_*": [
+        {"check": "rows_eq", "value": 200000},
+        {"check": "required_columns_present",
+         "columns": ["tpep_pickup_datetime", "tpep_dropoff_datetime", "PULocationID", "DOLocationID"]},
+    ],
+    "chicago_crimes_*_200k": [
+        {"check": "rows_eq", "value": 200000},
+    ],
+    "noaa_*": [
+        {"check": "has_column", "column": "DATE"},
+        {"check": "any_column_of", "name": "has_weather_metrics", "columns": ["PRCP", "SNOW", "SNWD", "TMAX", "TMIN", "TAVG"]},
+    ],
+}
+
+CHECKS = {"manifest_has_sha256", "rows_eq", "nrows_gt", "columns_gt", "no_duplicate_columns",
+          "required_columns_present", "has_column", "any_column_of"}
+
+def claim_name(rule) -> str:
+    c = rule["check"]
+    if "name" in rule: return rule["name"]
+    if c in ("rows_eq", "nrows_gt", "columns_gt"): return f"{c}_{rule['value']}"
+    if c == "has_column": return f"has_{rule['column']}_column"
+    return c
+
+def rules_for(slug, table):
+    out = {}
+    for pat, rules in table.items():
+        if fnmatch.fnmatch(slug, pat):
+            for r in rules: out[claim_name(r)] = r
+    return list(out.items())
+
+# ---------- metadata ----------
+def csv_meta(path, chunk=1<<24):
+    """
+    Header via csv.reader on the first line; data rows = newline count - 1 (+1 if the
+    file lacks a trailing newline). Assumes no newlines inside quoted fields.
+    """
+    with open(path, "rb") as f:
+        header = next(csv.reader(io.TextIOWrapper(f, encoding="utf-8-sig", errors="replace", newline="")), [])
+    lines, last = 0, b"\n"
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            b = f.read(chunk)
+            if not b: break
+            lines += int(np.count_nonzero(np.frombuffer(b, dtype=np.uint8) == 10))
+            last = b[-1:]
+    if last != b"\n": lines += 1
+    return {"nrows": max(0, lines - 1), "columns": header, "method": "csv newline scan"}
+
+def parquet_meta(path):
+    import pyarrow.parquet as pq
+    md = pq.read_metadata(path)
+    schema = md.schema.to_arrow_schema()
+    # pandas-written index columns are not data; a default RangeIndex is stored as a dict, not a column name
+    index = {c for c in (schema.pandas_metadata or {}).get("index_columns", []) if isinstance(c, str)}
+    return {"nrows": md.num_rows, "columns": [c for c in schema.names if c not in index], "method": "parquet footer"}
+
+def data_file(d):
+    for name in ("data.parquet", "data.csv"):
+        p = os.path.join(d, name)
+        if os.path.isfile(p): return p
+    return None
+
+def manifest_sha(M):
+    # top-level "sha256", else the first non-empty one in nested file entries
+    if isinstance(M, dict):
+        if M.get("sha256"): return M["sha256"]
+        vals = M.values()
+    elif isinstance(M, list):
+        vals = M
+    else:
+        return None
+    for v in vals:
+        s = manifest_sha(v)
+        if s: return s
+    return None
+
+# ---------- checks ----------
+def expected_of(rule):
+    c = rule["check"]
+    if c == "manifest_has_sha256": return "non-empty sha256"
+    if c == "rows_eq": return rule["value"]
+    if c in ("nrows_gt", "columns_gt"): return f">{rule['value']}"
+    if c == "no_duplicate_columns": return "unique columns"
+    if c == "required_columns_present": return rule["columns"]
+    if c == "has_column": return rule["column"]
+    return "one of " + ",".join(rule["columns"])
+
+def evaluate(rule, meta, M):
+    """-> (pass, actual); row/column checks fail with actual=None when there is no data file."""
+    c = rule["check"]
+    if c == "manifest_has_sha256":
+        sha = manifest_sha(M)
+        return bool(sha), sha
+    if meta is None:
+        return False, None
+    cols = meta["columns"]
+    if c == "rows_eq":
+        return meta["nrows"] == rule["value"], meta["nrows"]
+    if c == "nrows_gt":
+        return meta["nrows"] > rule["value"], meta["nrows"]
+    if c == "columns_gt":
+        return len(cols) > rule["value"], len(cols)
+    if c == "no_duplicate_columns":
+        dups = len(cols) - len(set(cols))
+        return dups == 0, dups
+    if c == "required_columns_present":
+        missing = [x for x in rule["columns"] if x not in cols]
+        return not missing, {"missing": missing, "columns": cols}
+    if c == "has_column":
+        return rule["column"] in cols, rule["column"] if rule["column"] in cols else None
+    hit = [x for x in rule["columns"] if x in cols]   # any_column_of
+    return bool(hit), hit
+
+def check_dataset(d, table):
+    """Every rule for one dataset; a read error fails the claims that depend on that file, with the error as actual."""
+    slug = os.path.basename(os.path.normpath(d))
+    mpath = os.path.join(d, "manifest.json")
+    M, meta, dpath = None, None, data_file(d)
+    m_err = d_err = None
+    try:
+        if os.path.isfile(mpath):
+            with open(mpath, "rb") as f: M = json.load(f)
+    except Exception as e:
+        m_err = f"{type(e).__name__}: {e}"
+    try:
+        if dpath:
+            meta = parquet_meta(dpath) if dpath.endswith(".parquet") else csv_meta(dpath)
+    except Exception as e:
+        d_err = f"{type(e).__name__}: {e}"
+    recs = []
+    for name, rule in rules_for(slug, table):
+        on_manifest = rule["check"] == "manifest_has_sha256"
+        err = m_err if on_manifest else d_err
+        if err is None:
+            try:
+                ok, actual = evaluate(rule, meta, M)
+            except Exception as e:
+                err = f"{type(e).__name__}: {e}"
+        if err is not None:
+            ok, actual = False, {"error": err}
+        recs.append({"dataset": slug, "claim": name, "pass": bool(ok), "expected": expected_of(rule), "actual": actual,
+                     "evidence": mpath if on_manifest or not dpath else dpath,
+                     "timestamp": datetime.now(timezone.utc).isoformat()})
+    return slug, meta, recs
+
+class NdjsonAppender:
+    """One O_APPEND write per dataset, so concurrent writers never interleave partial records."""
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+        self.lock = threading.Lock()
+
+    def write(self, recs):
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in recs).encode("utf-8")
+        with self.lock:
+            n = 0
+            while n < len(data): n += os.write(self.fd, data[n:])
+
+    def close(self):
+        os.close(self.fd)
+
+def main():
+    ap = argparse.ArgumentParser(description="Metadata-only dataset checks -> claims NDJSON")
+    ap.add_argument("--data-root", default=os.path.join("datasets", "out"))
+    ap.add_argument("--rules", default=None, help="JSON {dataset_glob: [rule, ...]} replacing the built-in rules")
+    ap.add_argument("--out", default="claims.ndjson", help="appended to; see --replace")
+    ap.add_argument("--replace", action="store_true", help="rewrite --out atomically instead of appending")
+    ap.add_argument("--only", default=None, help="comma list of dataset globs")
+    ap.add_argument("--jobs", type=int, default=min(32, (os.cpu_count() or 1) * 4))
+    ap.add_argument("--strict", action="store_true", help="exit 1 if any claim fails")
+    args = ap.parse_args()
+
+    table = DEFAULT_RULES
+    if args.rules:
+        with open(args.rules, "r", encoding="utf-8-sig") as f: table = json.load(f)
+    bad = sorted({r.get("check") for rules in table.values() for r in rules} - CHECKS)
+    if bad:
+        print(f"ERROR: unknown checks {bad}; known: {sorted(CHECKS)}"); sys.exit(2)
+    dirs = sorted(os.path.join(args.data_root, e) for e in os.listdir(args.data_root)
+                  if os.path.isdir(os.path.join(args.data_root, e)))
+    if args.only:
+        pats = [p.strip() for p in args.only.split(",") if p.strip()]
+        dirs = [d for d in dirs if any(fnmatch.fnmatch(os.path.basename(d), p) for p in pats)]
+
+    tmp = args.out + ".tmp" if args.replace else None
+    if tmp and os.path.exists(tmp): os.remove(tmp)
+    out = NdjsonAppender(tmp or args.out)
+    n_pass = n_fail = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as ex:
+            for slug, meta, recs in ex.map(lambda d: check_dataset(d, table), dirs):
+                out.write(recs)
+                fails = [r["claim"] for r in recs if not r["pass"]]
+                n_pass += len(recs) - len(fails); n_fail += len(fails)
+                shape = f"{meta['nrows']:,} x {len(meta['columns'])} ({meta['method']})" if meta else \
+                    ("unreadable data file" if data_file(os.path.join(args.data_root, slug)) else "no data file")
+                print(f"{slug:32} {shape:44} " + ("OK" if not fails else "FAIL " + ",".join(fails)))
+    finally:
+        out.close()
+    if tmp: os.replace(tmp, args.out)
+    print(f"\n{len(dirs)} datasets, {n_pass} pass, {n_fail} fail -> {args.out}")
+    sys.exit(1 if args.strict and n_fail else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,30 @@
 ﻿import os, json, time
 from pathlib import Path
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.figure import Figure
+
+# matplotlib is imported on first use only; EDU_NO_PLOT=1 (or the runner's --no-plot) skips figures
+_NO_PLOT = os.environ.get("EDU_NO_PLOT", "") not in ("", "0")
+PLUGINS = {}
+
+def register(name):
+    """Register a module's main(argv) under a short name for the edu runner."""
+    def deco(fn):
+        PLUGINS[name] = fn
+        return fn
+    return deco
+
+def set_no_plot(flag=True):
+    global _NO_PLOT
+    _NO_PLOT = bool(flag)
+
+def plotting_enabled():
+    return not _NO_PLOT
+
+def pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
 
 def now_iso():
     return time.strftime("%Y-%m-%dT%H:%M:%S%z")
@@ -25,6 +47,9 @@ def save_plot(arg1, path=None):
     save_plot("path.png")              # uses current figure
     save_plot(fig, "path.png")         # saves that figure
     """
+    if not plotting_enabled(): return
+    plt = pyplot()
+    from matplotlib.figure import Figure
     if path is None:
         # called as save_plot("path.png")
         fig = plt.gcf()
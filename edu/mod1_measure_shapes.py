@@ -1,7 +1,6 @@
 ﻿import argparse, os
 import numpy as np
-import matplotlib.pyplot as plt
-from common import now_iso, write_manifest, save_plot
+from common import now_iso, write_manifest, save_plot, plotting_enabled, pyplot, register
 
 def f(x):
     # f(x) = sin(1/x), safe near 0 with NaNs set to 0
@@ -17,7 +16,8 @@ def riemann_midpoint(func, a, b, n):
     s = np.sum(func(xm))
     return float(h * s)  # ensure plain Python float
 
-def main():
+@register("mod1")
+def main(argv=None):
     p = argparse.ArgumentParser()
     p.add_argument("--a", type=float, default=0.001)
     p.add_argument("--b", type=float, default=1.0)
@@ -25,30 +25,34 @@ def main():
     p.add_argument("--eps", type=float, default=1e-3)  # accepted but unused in this demo
     p.add_argument("--plot", default=os.path.join("edu_out","mod1","riemann.png"))
     p.add_argument("--out",  default=os.path.join("edu_out","mod1","measure.json"))
-    args = p.parse_args()
+    args = p.parse_args(argv)
 
     # compute midpoint estimate
     est = riemann_midpoint(f, args.a, args.b, args.n)
 
     # figure
-    os.makedirs(os.path.dirname(args.plot), exist_ok=True)
-    xs = np.linspace(args.a, args.b, 2000)
-    ys = f(xs)
-    plt.figure(figsize=(6,3))
-    plt.plot(xs, ys, linewidth=1)
+    artifacts = {}
+    if plotting_enabled():
+        plt = pyplot()
+        os.makedirs(os.path.dirname(args.plot), exist_ok=True)
+        xs = np.linspace(args.a, args.b, 2000)
+        ys = f(xs)
+        plt.figure(figsize=(6,3))
+        plt.plot(xs, ys, linewidth=1)
 
-    # a small set of rectangles for visualization
-    nrect = min(60, max(1, args.n))
-    hr = (args.b - args.a) / nrect
-    i = np.arange(nrect)
-    xm = args.a + (i + 0.5) * hr
-    fm = f(xm)
-    for xi, yi in zip(xm, fm):
-        plt.plot([xi-0.5*hr, xi+0.5*hr, xi+0.5*hr, xi-0.5*hr, xi-0.5*hr],
-                 [0,0,yi,yi,0], linewidth=0.5)
-    plt.title("Midpoint Riemann sum of sin(1/x) on [0.001, 1]")
-    plt.xlabel("x"); plt.ylabel("f(x)")
-    save_plot(args.plot)
+        # a small set of rectangles for visualization
+        nrect = min(60, max(1, args.n))
+        hr = (args.b - args.a) / nrect
+        i = np.arange(nrect)
+        xm = args.a + (i + 0.5) * hr
+        fm = f(xm)
+        for xi, yi in zip(xm, fm):
+            plt.plot([xi-0.5*hr, xi+0.5*hr, xi+0.5*hr, xi-0.5*hr, xi-0.5*hr],
+                     [0,0,yi,yi,0], linewidth=0.5)
+        plt.title("Midpoint Riemann sum of sin(1/x) on [0.001, 1]")
+        plt.xlabel("x"); plt.ylabel("f(x)")
+        save_plot(args.plot)
+        artifacts["riemann_plot"] = args.plot
 
     # manifest
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
@@ -57,7 +61,7 @@ def main():
         "timestamp": now_iso(),
         "params": {"a": args.a, "b": args.b, "n": args.n, "eps": args.eps},
         "metrics": {"integral_midpoint": est},
-        "artifacts": {"riemann_plot": args.plot}
+        "artifacts": artifacts
     })
 
     print(f"[mod1] integral≈{est:.6f}; plot→ {args.plot}; manifest→ {args.out}")
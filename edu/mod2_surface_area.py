@@ -1,16 +1,17 @@
 ﻿import argparse, numpy as np
-from common import now_iso, write_manifest
+from common import now_iso, write_manifest, register
 
 def delta_sigma(F, sigma):
     return (1.0/(sigma*np.sqrt(2*np.pi))) * np.exp(-0.5*(F/sigma)**2)
 
-def main():
+@register("mod2")
+def main(argv=None):
     ap=argparse.ArgumentParser()
     ap.add_argument("--box", type=float, default=1.2, help="integrate over [-box,box]^3")
     ap.add_argument("--dx", type=float, default=0.02)
     ap.add_argument("--sigma", type=float, default=0.02)
     ap.add_argument("--out", default="edu_out/mod2/surface.json")
-    args=ap.parse_args()
+    args=ap.parse_args(argv)
 
     L=args.box; dx=args.dx; sig=args.sigma
     xs=np.arange(-L,L+dx,dx); ys=xs; zs=xs
@@ -1,48 +1,135 @@
-﻿import argparse, numpy as np
-from PIL import Image
-from common import now_iso, write_manifest, save_plot
-from matplotlib import pyplot as plt
+﻿import argparse, os, numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from common import now_iso, write_manifest, save_plot, plotting_enabled, pyplot, register
 
-def laplacian(u):
-    return (-4*u + np.roll(u,1,0)+np.roll(u,-1,0)+np.roll(u,1,1)+np.roll(u,-1,1))
+class Diffusion:
+    """In-place periodic 5-point Laplacian stencil with preallocated buffers."""
+    def __init__(self, shape, dtype=np.float64):
+        self.lap = np.empty(shape, dtype=dtype)
+        self.tmp = np.empty(shape, dtype=dtype)
 
-def main():
+    def step(self, u, g, tau, lmb):
+        lap, tmp = self.lap, self.tmp
+        np.multiply(u, -4, out=lap)
+        lap[1:] += u[:-1];      lap[0] += u[-1]
+        lap[:-1] += u[1:];      lap[-1] += u[0]
+        lap[:,1:] += u[:,:-1];  lap[:,0] += u[:,-1]
+        lap[:,:-1] += u[:,1:];  lap[:,-1] += u[:,0]
+        np.subtract(u, g, out=tmp); tmp *= lmb
+        lap -= tmp; lap *= tau
+        u += lap
+
+    def run(self, u, g, steps, tau, lmb):
+        for _ in range(steps): self.step(u, g, tau, lmb)
+        return u
+
+def load_raster(path):
+    # .npy rasters are memory-mapped; anything else goes through PIL as 8-bit gray
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    from PIL import Image
+    return np.asarray(Image.open(path).convert("L"))
+
+def read_block(src, rows, cols, dtype):
+    idx = (rows, cols) if isinstance(rows, slice) else np.ix_(rows, cols)
+    blk = np.asarray(src[idx], dtype=dtype)
+    # integer rasters map their full type range to [0, 1] (uint8: /255, uint16: /65535)
+    if np.issubdtype(src.dtype, np.integer): blk *= dtype(1/np.iinfo(src.dtype).max)
+    return blk
+
+def smooth_tiled(src, out, steps, tau, lmb, tile, dtype, workers):
+    """
+    Smooth `src` into `out` tile by tile. Each tile is read with a wrap-around halo of
+    `steps` pixels, which is exactly the region of influence after `steps` stencil
+    applications, so the stitched result matches the whole-image run.
+    """
+    H, W = src.shape; h = steps
+    jobs = [(r0, c0) for r0 in range(0, H, tile) for c0 in range(0, W, tile)]
+    def one(job):
+        r0, c0 = job
+        r1 = min(H, r0+tile); c1 = min(W, c0+tile)
+        rows = np.arange(r0-h, r1+h) % H
+        cols = np.arange(c0-h, c1+h) % W
+        g = read_block(src, rows, cols, dtype)
+        u = g.copy()
+        Diffusion(g.shape, dtype).run(u, g, steps, tau, lmb)
+        out[r0:r1, c0:c1] = u[h:h+(r1-r0), h:h+(c1-c0)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        list(ex.map(one, jobs))
+    return out
+
+def dirichlet_energy(u, chunk=4096):
+    # ∫|∇u|^2 dx ≈ sum of squared forward diffs, accumulated over row bands
+    H = u.shape[0]; total = 0.0
+    for r0 in range(0, H, chunk):
+        r1 = min(H, r0+chunk)
+        band = np.asarray(u[r0:min(H, r1+1)], dtype=np.float64)
+        ux = np.diff(band[:r1-r0], axis=1, append=band[:r1-r0,-1:])
+        uy = np.diff(band, axis=0, append=band[-1:,:])[:r1-r0]
+        total += float((ux*ux).sum() + (uy*uy).sum())
+    return total
+
+@register("mod3")
+def main(argv=None):
     ap=argparse.ArgumentParser()
-    ap.add_argument("--image", required=True)
+    ap.add_argument("--image", required=True, help="PIL-readable image or .npy raster (memory-mapped)")
     ap.add_argument("--lambda", dest="lmb", type=float, default=0.2)
     ap.add_argument("--steps", type=int, default=100)
     ap.add_argument("--tau", type=float, default=0.1)
+    ap.add_argument("--dtype", choices=["float64","float32"], default="float64")
+    ap.add_argument("--tile", type=int, default=0, help="tile side in pixels; 0 = whole image in memory")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--u-out", default=None, help="optional .npy path for the smoothed raster (memory-mapped)")
     ap.add_argument("--out", default="edu_out/mod3/sat.json")
     ap.add_argument("--plot", default="edu_out/mod3/sat.png")
-    args=ap.parse_args()
-
-    g = Image.open(args.image).convert("L")
-    g = np.asarray(g, dtype=np.float64)/255.0
-    u = g.copy()
-    for _ in range(args.steps):
-        u += args.tau*(laplacian(u) - args.lmb*(u-g))  # gradient descent
-
-    # energy ∫|∇u|^2 dx ≈ sum of squared forward diffs
-    ux = np.diff(u, axis=1, append=u[:,-1:])
-    uy = np.diff(u, axis=0, append=u[-1:,:])
-    H1 = float((ux*ux+uy*uy).sum())
-
-    seg = (u>0.5).astype(float)
-    fig,axs=plt.subplots(1,3, figsize=(9,3))
-    axs[0].imshow(g, cmap="gray"); axs[0].set_title("input")
-    axs[1].imshow(u, cmap="gray"); axs[1].set_title("smoothed")
-    axs[2].imshow(seg, cmap="gray"); axs[2].set_title("threshold 0.5")
-    for a in axs: a.axis("off")
-    save_plot(fig, args.plot)
+    args=ap.parse_args(argv)
+
+    dtype = np.dtype(args.dtype).type
+    src = load_raster(args.image)
+    H, W = src.shape
+    if args.u_out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.u_out)), exist_ok=True)
+        u = np.lib.format.open_memmap(args.u_out, mode="w+", dtype=dtype, shape=(H, W))
+    else:
+        u = np.empty((H, W), dtype=dtype)
+
+    if args.tile and (args.tile < H or args.tile < W):
+        smooth_tiled(src, u, args.steps, args.tau, args.lmb, args.tile, dtype, args.workers)
+    else:
+        g = read_block(src, slice(None), slice(None), dtype)
+        u[:] = g
+        Diffusion(g.shape, dtype).run(u, g, args.steps, args.tau, args.lmb)  # gradient descent
+
+    H1 = dirichlet_energy(u)
+
+    artifacts = {}
+    if plotting_enabled():
+        # preview at most ~1024 px per side
+        plt = pyplot()
+        s = max(1, -(-max(H, W)//1024))
+        g_prev = read_block(src, slice(None, None, s), slice(None, None, s), dtype)
+        u_prev = np.asarray(u[::s, ::s])
+        seg = (u_prev>0.5).astype(float)
+        fig,axs=plt.subplots(1,3, figsize=(9,3))
+        axs[0].imshow(g_prev, cmap="gray"); axs[0].set_title("input")
+        axs[1].imshow(u_prev, cmap="gray"); axs[1].set_title("smoothed")
+        axs[2].imshow(seg, cmap="gray"); axs[2].set_title("threshold 0.5")
+        for a in axs: a.axis("off")
+        save_plot(fig, args.plot)
+        artifacts["preview"] = args.plot
 
+    if isinstance(u, np.memmap): u.flush()
+    if args.u_out: artifacts["smoothed"] = args.u_out
     write_manifest(args.out, {
         "module":"mod3_satellite_classifier",
         "created_at": now_iso(),
-        "parameters":{"lambda":args.lmb,"steps":args.steps,"tau":args.tau},
+        "parameters":{"lambda":args.lmb,"steps":args.steps,"tau":args.tau,
+                      "dtype":args.dtype,"tile":args.tile,"shape":[H, W],"input_dtype":str(src.dtype)},
         "metrics":{"dirichlet_energy": H1},
-        "artifacts":{"preview": args.plot}
+        "artifacts": artifacts
     })
-    print(f"[mod3] H1 energy={H1:.3f}; plot→ {args.plot}; manifest→ {args.out}")
+    plot = f"plot→ {args.plot}; " if "preview" in artifacts else ""
+    print(f"[mod3] H1 energy={H1:.3f}; {plot}manifest→ {args.out}")
 
 if __name__=="__main__":
     main()
@@ -1,61 +1,139 @@
-﻿import argparse, numpy as np
-from common import now_iso, write_manifest, save_plot
-from matplotlib import pyplot as plt
-
-def read_fasta_text(path):
-    seq=[]; 
-    with open(path,"r",encoding="utf-8",errors="ignore") as f:
-        for line in f:
-            if not line or line[0]==">": continue
-            seq.append(line.strip().upper())
-    return "".join(seq)
-
-def sliding_density(seq, win=1000):
-    v=np.frombuffer(seq.encode("ascii"), dtype="S1")
-    is_gc = np.isin(v, [b"G",b"C"]).astype(float)
-    k=len(is_gc)
-    if k<win: return np.array([])
-    cumsum = np.concatenate([[0.0], np.cumsum(is_gc)])
-    dens = (cumsum[win:] - cumsum[:-win]) / win
-    return dens
-
-def bmo_star(vals):
+﻿import argparse, os, numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+from common import now_iso, write_manifest, save_plot, plotting_enabled, pyplot, register
+
+CHUNK = 1 << 22  # bytes scanned per vectorized pass
+
+# byte lookup tables: whitespace is dropped, G/C (either case) count as GC
+_KEEP = np.ones(256, dtype=bool); _KEEP[:33] = False
+_GC = np.zeros(256, dtype=np.uint8); _GC[list(b"GCgc")] = 1
+
+def _line_end(buf, i, n):
+    while i < n:
+        j = np.flatnonzero(buf[i:i+4096] == ord("\n"))
+        if len(j): return i + int(j[0])
+        i += 4096
+    return n
+
+def fasta_records(path, chunk=CHUNK):
+    """Yield (name, body_start, body_end) byte ranges of every record, scanning the mmap in chunks."""
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    n = len(buf); heads = []
+    for o in range(0, n, chunk):
+        blk = buf[o:o+chunk]
+        pos = np.flatnonzero(blk == ord(">"))
+        if len(pos) == 0: continue
+        prev = np.where(pos > 0, blk[np.maximum(pos-1, 0)], buf[o-1] if o else ord("\n"))
+        heads.extend((pos[prev == ord("\n")] + o).tolist())
+    if not heads:
+        if n: yield "seq", 0, n
+        return
+    if _KEEP[buf[:heads[0]]].any():
+        raise ValueError(f"{path}: sequence data before the first '>' header")
+    for k, h in enumerate(heads):
+        nl = _line_end(buf, h, n)
+        name = bytes(buf[h+1:nl]).decode("ascii", "replace").split()
+        end = heads[k+1] if k+1 < len(heads) else n
+        yield (name[0] if name else f"record{k}"), min(nl+1, end), end
+
+def gc_window_counts(path, start, end, win, step, chunk=CHUNK):
+    """
+    Stream one record body and return (n_bases, n_gc, dens) where dens[i] is the GC
+    fraction of bases [i*step, i*step+win). Only integer prefix counts at the
+    sampled window edges are kept, never the sequence itself.
+    """
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    lo, hi = [np.zeros(1, dtype=np.int64)], []   # prefix counts at q=k*step and q=k*step+win
+    n = 0; carry = 0
+    for o in range(start, end, chunk):
+        raw = buf[o:min(end, o+chunk)]
+        gc = _GC[raw[_KEEP[raw]]]
+        L = len(gc)
+        if L == 0: continue
+        cs = np.cumsum(gc, dtype=np.int64); cs += carry
+        # prefix c[q] for q in [n+1, n+L] lives at cs[q-n-1]
+        qa = np.arange(-(-(n+1)//step)*step, n+L+1, step)
+        lo.append(cs[qa-n-1])
+        k0 = max(0, -(-(n+1-win)//step))
+        qb = np.arange(k0*step+win, n+L+1, step)
+        if len(qb): hi.append(cs[qb-n-1])
+        carry = int(cs[-1]); n += L
+    if n < win: return n, carry, np.array([])
+    hi = np.concatenate(hi); lo = np.concatenate(lo)[:len(hi)]
+    return n, carry, (hi - lo) / win
+
+def _record_job(job):
+    path, name, start, end, win, step = job
+    n, n_gc, dens = gc_window_counts(path, start, end, win, step)
+    return name, n, n_gc, dens
+
+def bmo_star(vals, rows=1 << 16):
     best=0.0
     for B in (16,32,64):
-        for i in range(0, len(vals)-B+1):
-            blk=vals[i:i+B]
-            m=blk.mean()
-            osc=np.mean(np.abs(blk-m))
-            if osc>best: best=osc
+        if len(vals) < B: continue
+        view = sliding_window_view(vals, B)
+        for i in range(0, len(view), rows):
+            blk = view[i:i+rows]
+            osc = np.abs(blk - blk.mean(axis=1, keepdims=True)).mean(axis=1)
+            best = max(best, float(osc.max()))
     return best
 
-def main():
+@register("mod4")
+def main(argv=None):
     ap=argparse.ArgumentParser()
     ap.add_argument("--fasta", required=True)
     ap.add_argument("--win", type=int, default=1000)
+    ap.add_argument("--step", type=int, default=None, help="window stride in bases (default: --win, i.e. tiled windows)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
     ap.add_argument("--out", default="edu_out/mod4/dna_bmo.json")
     ap.add_argument("--plot", default="edu_out/mod4/dna_bmo.png")
-    args=ap.parse_args()
+    ap.add_argument("--dens-out", default="edu_out/mod4/dna_density.npz")
+    args=ap.parse_args(argv)
+    if args.step is None: args.step = args.win
+
+    jobs = [(args.fasta, name, s, e, args.win, args.step) for name, s, e in fasta_records(args.fasta)]
+    if args.workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as ex:
+            results = list(ex.map(_record_job, jobs))
+    else:
+        results = [_record_job(j) for j in jobs]
+
+    contigs = []; dens_list = []
+    for name, n, n_gc, dens in results:
+        bmo = float(bmo_star(dens)) if len(dens) else 0.0
+        contigs.append({"name": name, "n_bases": n, "gc_fraction": n_gc/n if n else 0.0,
+                        "n_windows": int(len(dens)), "bmo_star": bmo})
+        dens_list.append(dens)
+    n_windows = sum(c["n_windows"] for c in contigs)
+    bmo = max((c["bmo_star"] for c in contigs), default=0.0)
 
-    seq = read_fasta_text(args.fasta)
-    dens = sliding_density(seq, args.win)
-    bmo = float(bmo_star(dens)) if len(dens) else 0.0
+    os.makedirs(os.path.dirname(os.path.abspath(args.dens_out)), exist_ok=True)
+    # indexed keys: contig names may repeat, contain '/' or shadow savez's own arguments
+    np.savez(args.dens_out, names=np.array([c["name"] for c in contigs], dtype=str),
+             **{f"d{i}": d for i, d in enumerate(dens_list)})
 
-    xs = np.arange(len(dens))
-    from matplotlib import pyplot as plt
-    fig=plt.figure(figsize=(9,3))
-    plt.plot(xs, dens, lw=0.7); plt.title(f"GC density (win={args.win})")
-    plt.xlabel("window index"); plt.ylabel("density")
-    save_plot(fig, args.plot)
+    artifacts = {"densities": args.dens_out}
+    if plotting_enabled():
+        plt = pyplot()
+        dens = np.concatenate(dens_list) if dens_list else np.array([])
+        s = max(1, len(dens) // 200_000)
+        xs = np.arange(0, len(dens), s)
+        fig=plt.figure(figsize=(9,3))
+        plt.plot(xs, dens[::s], lw=0.7); plt.title(f"GC density (win={args.win}, step={args.step})")
+        plt.xlabel("window index"); plt.ylabel("density")
+        save_plot(fig, args.plot)
+        artifacts["plot"] = args.plot
 
     write_manifest(args.out, {
         "module":"mod4_dna_bmo",
         "created_at": now_iso(),
-        "parameters":{"win":args.win},
-        "metrics":{"n_windows": int(len(dens)), "bmo_star": bmo},
-        "artifacts":{"plot": args.plot}
+        "parameters":{"win":args.win, "step":args.step},
+        "metrics":{"n_windows": int(n_windows), "bmo_star": bmo, "contigs": contigs},
+        "artifacts": artifacts
     })
-    print(f"[mod4] windows={len(dens)} BMO*={bmo:.6f}; plot→ {args.plot}; manifest→ {args.out}")
+    plot = f"plot→ {args.plot}; " if "plot" in artifacts else ""
+    print(f"[mod4] contigs={len(contigs)} windows={n_windows} BMO*={bmo:.6f}; {plot}manifest→ {args.out}")
 
 if __name__=="__main__":
     main()
@@ -1,6 +1,5 @@
-﻿import argparse, numpy as np, math
-from common import now_iso, write_manifest, save_plot
-from matplotlib import pyplot as plt
+﻿import argparse, os, numpy as np, math
+from common import now_iso, write_manifest, save_plot, plotting_enabled, pyplot, register
 
 def logistic_series(r, x0, N, burn=1000):
     x=x0
@@ -21,7 +20,101 @@ def symbol_entropy(bits, k=3):
     Hk = -sum(p*math.log2(p) for p in ps)
     return Hk / k
 
-def main():
+def logistic_sweep(rs, x0s, N, burn=1000, k_max=8, keep=200, block=256):
+    """
+    Evolve every (r, x0) pair at once. Returns Lyapunov exponents (R,M), k-gram
+    entropies per symbol (R,M,k_max) for k=1..k_max, and the last `keep` iterates.
+    k-grams are rolling integer codes; only k_max-gram counts are accumulated and
+    lower orders are marginalized from them.
+    """
+    r = np.asarray(rs, dtype=np.float64)[:, None]
+    x = np.empty((len(rs), len(x0s))); x[:] = np.asarray(x0s, dtype=np.float64)[None, :]
+    shape, T = x.shape, x.size
+    tmp = np.empty_like(x); lyap = np.zeros_like(x); bit = np.empty(shape, dtype=bool)
+    def step():
+        np.subtract(1.0, x, out=tmp); np.multiply(r, x, out=x); np.multiply(x, tmp, out=x)
+    for _ in range(burn): step()
+
+    K = 1 << k_max; block = max(block, k_max)
+    code = np.zeros(shape, dtype=np.int64)
+    codes = np.empty((block,)+shape, dtype=np.int64)
+    base = (np.arange(T, dtype=np.int64) * K).reshape(shape)
+    counts = np.zeros(T*K, dtype=np.int64)
+    early = None
+    tail = np.empty((min(keep, N),)+shape)
+    t = 0
+    with np.errstate(divide="ignore"):
+        while t < N:
+            b = min(block, N-t)
+            for j in range(b):
+                step()
+                np.multiply(x, -2.0, out=tmp); tmp += 1.0; tmp *= r
+                np.abs(tmp, out=tmp); np.log(tmp, out=tmp); lyap += tmp
+                np.greater(x, 0.5, out=bit)
+                code <<= 1; code |= bit; code &= K-1
+                codes[j] = code
+                if t+j >= N-len(tail): tail[t+j-(N-len(tail))] = x
+            if t == 0: early = codes[:min(b, k_max-1)].copy()
+            s0 = max(0, k_max-1-t)
+            if s0 < b:
+                counts += np.bincount((codes[s0:b] + base).ravel(), minlength=T*K)
+            t += b
+    lyap /= max(1, N)
+
+    full = counts.reshape(shape + (K,))
+    H = np.zeros(shape + (k_max,))
+    for k in range(1, k_max+1):
+        ck = full.reshape(shape + (K >> k, 1 << k)).sum(axis=-2)
+        if k < k_max:
+            e = early[k-1:] & ((1 << k)-1)
+            if len(e):
+                flat = ck.reshape(T, 1 << k)
+                flat += np.bincount((e + (np.arange(T, dtype=np.int64) << k).reshape(shape)).ravel(),
+                                    minlength=T << k).reshape(T, 1 << k)
+        tot = ck.sum(axis=-1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = ck / np.maximum(tot, 1)
+            H[..., k-1] = -np.sum(np.where(p > 0, p*np.log2(p), 0.0), axis=-1) / k
+    return lyap, H, tail
+
+def run_sweep(args):
+    rs = np.linspace(args.r_min, args.r_max, args.r_num)
+    if args.x0_num == 1: x0s = np.array([args.x0])
+    else: x0s = np.random.default_rng(args.seed).uniform(0.01, 0.99, args.x0_num)
+    lyap, H, tail = logistic_sweep(rs, x0s, args.N, k_max=args.k_max, keep=args.keep)
+
+    np.savez_compressed(args.sweep_out, r=rs, x0=x0s, lyapunov=lyap.astype(np.float32),
+                        entropy_k=H.astype(np.float32), k=np.arange(1, args.k_max+1),
+                        tail=tail.astype(np.float32))
+    lam_r = lyap.mean(axis=1)
+    i_max = int(np.nanargmax(lam_r))
+
+    artifacts = {"sweep": args.sweep_out}
+    if plotting_enabled():
+        plt = pyplot()
+        fig,axs=plt.subplots(1,2, figsize=(9,3))
+        rr = np.broadcast_to(rs[None,:,None], tail.shape)
+        axs[0].plot(rr.ravel(), tail.ravel(), ",k", alpha=0.3); axs[0].set_title("bifurcation diagram")
+        axs[1].plot(rs, lam_r, lw=0.7); axs[1].axhline(0, color="gray", lw=0.5); axs[1].set_title("Lyapunov exponent vs r")
+        save_plot(fig, args.plot)
+        artifacts["plot"] = args.plot
+
+    write_manifest(args.out, {
+        "module":"mod5_chaos",
+        "created_at": now_iso(),
+        "parameters":{"sweep": True, "r_min":args.r_min, "r_max":args.r_max, "r_num":args.r_num,
+                      "x0": args.x0, "x0_num":args.x0_num, "seed":args.seed,
+                      "N":args.N, "k_max":args.k_max, "keep":args.keep},
+        "metrics":{"lyapunov_max": float(lam_r[i_max]), "r_at_lyapunov_max": float(rs[i_max]),
+                   "frac_r_chaotic": float(np.mean(lam_r > 0)),
+                   "entropy_k_bits_per_step_mean": H.mean(axis=(0,1))},
+        "artifacts": artifacts
+    })
+    print(f"[mod5] sweep r∈[{args.r_min},{args.r_max}]×{args.r_num}, x0×{args.x0_num}: "
+          f"λ_max={lam_r[i_max]:.4f} at r={rs[i_max]:.4f}; sweep→ {args.sweep_out}; manifest→ {args.out}")
+
+@register("mod5")
+def main(argv=None):
     ap=argparse.ArgumentParser()
     ap.add_argument("--r", type=float, default=4.0)
     ap.add_argument("--x0", type=float, default=0.123456)
@@ -29,7 +122,20 @@ def main():
     ap.add_argument("--k", type=int, default=3)
     ap.add_argument("--out", default="edu_out/mod5/chaos.json")
     ap.add_argument("--plot", default="edu_out/mod5/chaos.png")
-    args=ap.parse_args()
+    ap.add_argument("--sweep", action="store_true", help="vectorized sweep over an r grid")
+    ap.add_argument("--r-min", type=float, default=2.5)
+    ap.add_argument("--r-max", type=float, default=4.0)
+    ap.add_argument("--r-num", type=int, default=10000)
+    ap.add_argument("--x0-num", type=int, default=1, help="initial conditions per r (1 = --x0 only)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--k-max", type=int, default=8)
+    ap.add_argument("--keep", type=int, default=200, help="iterates kept per trajectory for the bifurcation diagram")
+    ap.add_argument("--sweep-out", default="edu_out/mod5/sweep.npz")
+    args=ap.parse_args(argv)
+
+    if args.sweep:
+        os.makedirs(os.path.dirname(os.path.abspath(args.sweep_out)), exist_ok=True)
+        return run_sweep(args)
 
     xs = logistic_series(args.r, args.x0, args.N)
     lam = lyapunov(args.r, xs)
@@ -37,17 +143,21 @@ def main():
     Hk = symbol_entropy(bits, k=args.k)
     hks = max(0.0, lam)/math.log(2.0)
 
-    fig,axs=plt.subplots(1,2, figsize=(9,3))
-    axs[0].plot(xs[:2000], lw=0.7); axs[0].set_title("logistic trajectory (first 2k)")
-    axs[1].hist(xs, bins=100); axs[1].set_title("empirical density")
-    save_plot(fig, args.plot)
+    artifacts = {}
+    if plotting_enabled():
+        plt = pyplot()
+        fig,axs=plt.subplots(1,2, figsize=(9,3))
+        axs[0].plot(xs[:2000], lw=0.7); axs[0].set_title("logistic trajectory (first 2k)")
+        axs[1].hist(xs, bins=100); axs[1].set_title("empirical density")
+        save_plot(fig, args.plot)
+        artifacts["plot"] = args.plot
 
     write_manifest(args.out, {
         "module":"mod5_chaos",
         "created_at": now_iso(),
         "parameters":{"r":args.r,"x0":args.x0,"N":args.N,"k":args.k},
         "metrics":{"lyapunov": lam, "entropy_k_bits_per_step": Hk, "h_KS_bits_per_step": hks},
-        "artifacts":{"plot": args.plot}
+        "artifacts": artifacts
     })
     print(f"[mod5] λ={lam:.4f}, H_{args.k}/step={Hk:.4f}, h_KS≈{hks:.4f}; plot→ {args.plot}; manifest→ {args.out}")
 
@@ -1,24 +1,21 @@
-﻿import argparse, os, json, zlib, bz2, lzma
+﻿import argparse, os, json, mmap, zlib, bz2, lzma
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from common import now_iso, write_manifest
+from common import now_iso, write_manifest, register
 
-def entropy_bits_per_byte(data: bytes) -> float:
-    if not data: return 0.0
-    b = np.frombuffer(data, dtype=np.uint8)
-    hist = np.bincount(b, minlength=256).astype(np.float64)
-    p = hist / hist.sum()
+def entropy_from_counts(hist) -> float:
+    hist = np.asarray(hist, dtype=np.float64)
+    Z = hist.sum()
+    if Z == 0: return 0.0
+    p = hist / Z
     p = p[p > 0]
     return float(-np.sum(p * np.log2(p)))
 
-def adjacent_mutual_info_bits(data: bytes) -> float:
-    if len(data) < 2: return 0.0
-    b = np.frombuffer(data, dtype=np.uint8)
-    x, y = b[:-1], b[1:]
-    joint, _, _ = np.histogram2d(x, y, bins=256, range=[[0,255],[0,255]])
-    joint = joint.astype(np.float64)
+def mutual_info_from_joint(joint) -> float:
+    joint = np.asarray(joint, dtype=np.float64).reshape(256, 256)
     Z = joint.sum()
     if Z == 0: return 0.0
-    joint /= Z
+    joint = joint / Z
     px = joint.sum(axis=1, keepdims=True)
     py = joint.sum(axis=0, keepdims=True)
     with np.errstate(divide="ignore", invalid="ignore"):
@@ -26,29 +23,91 @@ def adjacent_mutual_info_bits(data: bytes) -> float:
         logterm[~np.isfinite(logterm)] = 0.0
     return float(np.sum(joint * logterm))
 
-def main():
+def bigram_counts(b) -> np.ndarray:
+    # joint counts of adjacent bytes, indexed x*256+y
+    b = np.asarray(b, dtype=np.uint8)
+    if len(b) < 2: return np.zeros(1 << 16, dtype=np.int64)
+    return np.bincount(b[:-1].astype(np.uint16) * 256 + b[1:], minlength=1 << 16)
+
+def entropy_bits_per_byte(data: bytes) -> float:
+    if not data: return 0.0
+    return entropy_from_counts(np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256))
+
+def adjacent_mutual_info_bits(data: bytes) -> float:
+    if len(data) < 2: return 0.0
+    return mutual_info_from_joint(bigram_counts(np.frombuffer(data, dtype=np.uint8)))
+
+COMPRESSORS = {
+    "zlib": lambda: zlib.compressobj(level=9),
+    "bz2":  lambda: bz2.BZ2Compressor(9),
+    "lzma": lambda: lzma.LZMACompressor(preset=6),
+}
+
+def compressed_size(make, buf, chunk) -> int:
+    c = make(); n = 0
+    for o in range(0, len(buf), chunk):
+        n += len(c.compress(buf[o:o+chunk]))
+    return n + len(c.flush())
+
+def analyze_stream(path, chunk=1 << 24):
+    """
+    Memory-mapped pass over `path`: byte and bigram counts are updated per chunk
+    while the three incremental compressors run in their own threads (they release
+    the GIL), each reading the same mapping. Returns (n, byte_counts, bigram_counts, sizes).
+    """
+    n = os.path.getsize(path)
+    hist = np.zeros(256, dtype=np.int64); joint = np.zeros(1 << 16, dtype=np.int64)
+    if n == 0:
+        return 0, hist, joint, {k: compressed_size(m, b"", chunk) for k, m in COMPRESSORS.items()}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            with ThreadPoolExecutor(max_workers=len(COMPRESSORS)) as ex:
+                futs = {k: ex.submit(compressed_size, m, view, chunk) for k, m in COMPRESSORS.items()}
+                arr = np.frombuffer(mm, dtype=np.uint8)
+                for o in range(0, n, chunk):
+                    # one byte of overlap carries the bigram across chunk edges
+                    blk = arr[o:o+chunk]
+                    hist += np.bincount(blk, minlength=256)
+                    joint += bigram_counts(arr[max(0, o-1):o+chunk])
+                del arr, blk
+                sizes = {k: f.result() for k, f in futs.items()}
+        finally:
+            view.release()
+    return n, hist, joint, sizes
+
+@register("mod6")
+def main(argv=None):
     ap = argparse.ArgumentParser()
     ap.add_argument("--file", required=True)
     ap.add_argument("--out",  default=os.path.join("edu_out","mod6","info.json"))
-    args = ap.parse_args()
+    ap.add_argument("--stream", action="store_true", help="memory-mapped chunked pass with concurrent compressors")
+    ap.add_argument("--chunk-mb", type=int, default=16)
+    args = ap.parse_args(argv)
 
-    data = open(args.file, "rb").read()
-    H = entropy_bits_per_byte(data)
-    I = adjacent_mutual_info_bits(data)
-    n = len(data)
-
-    comp_bytes = {
-        "zlib": zlib.compress(data, level=9),
-        "bz2":  bz2.compress(data, compresslevel=9),
-        "lzma": lzma.compress(data, preset=6),
-    }
-    ratios = {k: len(v)/n if n else 0.0 for k, v in comp_bytes.items()}
-    sizes  = {"original": n, **{k: len(v) for k, v in comp_bytes.items()}}
+    if args.stream:
+        n, hist, joint, comp_sizes = analyze_stream(args.file, chunk=args.chunk_mb << 20)
+        H = entropy_from_counts(hist)
+        I = mutual_info_from_joint(joint)
+    else:
+        data = open(args.file, "rb").read()
+        H = entropy_bits_per_byte(data)
+        I = adjacent_mutual_info_bits(data)
+        n = len(data)
+        comp_sizes = {
+            "zlib": len(zlib.compress(data, level=9)),
+            "bz2":  len(bz2.compress(data, compresslevel=9)),
+            "lzma": len(lzma.compress(data, preset=6)),
+        }
+    ratios = {k: v/n if n else 0.0 for k, v in comp_sizes.items()}
+    sizes  = {"original": n, **comp_sizes}
 
+    params = {"file": os.path.abspath(args.file)}
+    if args.stream: params.update(stream=True, chunk_mb=args.chunk_mb)
     payload = {
         "module": "mod6_info",
         "created_at": now_iso(),
-        "parameters": {"file": os.path.abspath(args.file)},
+        "parameters": params,
         "metrics": {
             "byte_entropy_bits": H,
             "adjacent_mutual_info_bits": I,
@@ -1,4 +1,4 @@
-﻿# Runs all Phase-1 demos and writes outputs into edu_out\...
+﻿# Runs all Phase-1 demos in one Python process (edu\run_edu.py) and writes outputs into edu_out\...
 # Forces Mod 6 to use a small file so sizes_bytes + the explanatory note appear.
 
 # --- Locate shared venv Python (..\ .venv) ---
@@ -9,16 +9,6 @@ if (-not (Test-Path $venvPy)) { Write-Error "Python venv not found. Run .\edu\se
 # Path to this folder (edu)
 $EDU = $PSScriptRoot
 
-# -------------------
-# Module 1
-# -------------------
-& $venvPy (Join-Path $EDU "mod1_measure_shapes.py") --eps 0.001 --n 20000
-
-# -------------------
-# Module 2
-# -------------------
-& $venvPy (Join-Path $EDU "mod2_surface_area.py") --box 1.2 --dx 0.02 --sigma 0.02
-
 # -------------------
 # Module 3  (need an image; synth one if none found)
 # -------------------
@@ -37,7 +27,6 @@ im.save(r'$synthPng')
   Remove-Item $tmpPy -Force
   $img = Get-Item $synthPng
 }
-& $venvPy (Join-Path $EDU "mod3_satellite_classifier.py") --image ($img.FullName) --lambda 0.2 --steps 100 --tau 0.1
 
 # -------------------
 # Module 4  (need a FASTA; toy if none)
@@ -51,12 +40,6 @@ if (-not $fasta) {
   Set-Content -Encoding ascii $toyFa $lines
   $fasta = Get-Item $toyFa
 }
-& $venvPy (Join-Path $EDU "mod4_dna_bmo.py") --fasta ($fasta.FullName) --win 1000
-
-# -------------------
-# Module 5
-# -------------------
-& $venvPy (Join-Path $EDU "mod5_chaos.py") --r 4.0 --N 20000 --k 3
 
 # -------------------
 # Module 6 — force a tiny file so sizes_bytes + explanatory note are present
@@ -64,6 +47,17 @@ if (-not $fasta) {
 $file = Join-Path $EDU "requirements.txt"
 # Optional: override the "small file" threshold (bytes) via env var if you want:
 # $env:EDU_SMALL_NOTE_THRESHOLD = "4096"
-& $venvPy (Join-Path $EDU "mod6_info.py") --file ($file)
+
+# -------------------
+# Modules 1-6 in one process (add --no-plot to skip figures, --jobs N to run in parallel)
+# -------------------
+& $venvPy (Join-Path $EDU "run_edu.py") `
+  --set "mod1=--eps 0.001 --n 20000" `
+  --set "mod2=--box 1.2 --dx 0.02 --sigma 0.02" `
+  --set ("mod3=--image `"{0}`" --lambda 0.2 --steps 100 --tau 0.1" -f $img.FullName) `
+  --set ("mod4=--fasta `"{0}`" --win 1000" -f $fasta.FullName) `
+  --set "mod5=--r 4.0 --N 20000 --k 3" `
+  --set ("mod6=--file `"{0}`"" -f $file)
+if ($LASTEXITCODE -ne 0) { Write-Error "One or more demos failed."; exit $LASTEXITCODE }
 
 Write-Host "`nAll demos done. See edu_out\ for manifests and PNGs."
@@ -0,0 +1,67 @@
+﻿import argparse, importlib, shlex, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+EDU = Path(__file__).resolve().parent
+if str(EDU) not in sys.path: sys.path.insert(0, str(EDU))
+import common
+
+def load_plugins():
+    # every mod*_*.py registers its main() through common.register on import
+    for p in sorted(EDU.glob("mod*_*.py")):
+        importlib.import_module(p.stem)
+    return common.PLUGINS
+
+def run_one(name, argv, no_plot):
+    common.set_no_plot(no_plot)
+    plugins = load_plugins()
+    t0 = time.perf_counter()
+    try:
+        plugins[name](argv)
+        err = None
+    except SystemExit as e:
+        err = None if not e.code else f"exit {e.code}"
+    except Exception as e:
+        err = f"{type(e).__name__}: {e}"
+    return name, time.perf_counter() - t0, err
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="run_edu", description="Run edu modules in one process")
+    ap.add_argument("modules", nargs="*", help="subset to run, e.g. mod1 mod5 (default: all)")
+    ap.add_argument("--set", action="append", default=[], metavar='NAME="ARGS"',
+                    help='per-module arguments, e.g. --set mod3="--image sat.png --steps 50"')
+    ap.add_argument("--no-plot", action="store_true", help="skip figures (matplotlib is never imported)")
+    ap.add_argument("--jobs", type=int, default=1, help="run modules in N worker processes")
+    ap.add_argument("--list", action="store_true")
+    args = ap.parse_args(argv)
+
+    plugins = load_plugins()
+    if args.list:
+        for name, fn in plugins.items(): print(f"{name:6} {fn.__module__}")
+        return 0
+    names = args.modules or list(plugins)
+    unknown = [n for n in names if n not in plugins]
+    if unknown: ap.error(f"unknown module(s): {', '.join(unknown)}")
+    extra = {}
+    for item in args.set:
+        name, _, rest = item.partition("=")
+        # non-POSIX split keeps Windows backslashes; surrounding quotes are stripped by hand
+        toks = shlex.split(rest, posix=False)
+        extra[name] = [t[1:-1] if len(t) > 1 and t[0] == t[-1] and t[0] in "\"'" else t for t in toks]
+
+    t0 = time.perf_counter()
+    jobs = [(n, extra.get(n, []), args.no_plot) for n in names]
+    if args.jobs > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as ex:
+            results = list(ex.map(run_one, *zip(*jobs)))
+    else:
+        results = [run_one(*j) for j in jobs]
+
+    print("\n— edu runner —")
+    for name, dt, err in results:
+        print(f"{name:6} {dt:8.2f}s  {'OK' if err is None else 'FAILED ' + err}")
+    print(f"total  {time.perf_counter() - t0:8.2f}s")
+    return 0 if all(err is None for _, _, err in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
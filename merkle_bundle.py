@@ -0,0 +1,63 @@
+﻿import hashlib, json, os
+
+SCHEME = "merkle-sha256-v1"
+
+def canonical(M) -> bytes:
+    return json.dumps(M, sort_keys=True).encode()
+
+def leaf_hash(name: str, canon: bytes) -> str:
+    # 0x00 / 0x01 prefixes keep leaves and inner nodes in separate domains; the name binds the slot
+    return hashlib.sha256(b"\x00" + name.encode("utf-8") + b"\x00" + canon).hexdigest()
+
+def node_hash(left: str, right: str) -> str:
+    return hashlib.sha256(b"\x01" + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+def build(leaves):
+    """
+    leaves: {name: leaf_hash}. Leaves are ordered by name and paired level by level;
+    an odd node is carried up unchanged. Returns (root, {name: proof}) where a proof
+    is a list of [sibling_hash, "L"|"R"] from the leaf up.
+    """
+    names = sorted(leaves)
+    if not names: return hashlib.sha256(b"").hexdigest(), {}
+    level = [(leaves[n], [n]) for n in names]
+    proofs = {n: [] for n in names}
+    while len(level) > 1:
+        nxt = []
+        for i in range(0, len(level) - 1, 2):
+            (hl, nl), (hr, nr) = level[i], level[i+1]
+            for n in nl: proofs[n].append([hr, "R"])
+            for n in nr: proofs[n].append([hl, "L"])
+            nxt.append((node_hash(hl, hr), nl + nr))
+        if len(level) % 2: nxt.append(level[-1])
+        level = nxt
+    return level[0][0], proofs
+
+def root_from_proof(leaf: str, proof) -> str:
+    h = leaf
+    for sib, side in proof:
+        h = node_hash(sib, h) if side == "L" else node_hash(h, sib)
+    return h
+
+class LeafCache:
+    """
+    Leaf hashes keyed by (name, raw-file sha256). Months that freeze byte-identical
+    manifests (rmsk, wiki-Vote) reuse the cached leaf instead of re-canonicalizing.
+    """
+    def __init__(self, path=None):
+        self.path = path; self.data = {}; self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f: self.data = json.load(f)
+            except Exception: self.data = {}
+
+    def leaf(self, name: str, raw_sha: str, load):
+        key = f"{name}:{raw_sha}"
+        if key not in self.data:
+            self.data[key] = leaf_hash(name, canonical(load()))
+            self.dirty = True
+        return self.data[key]
+
+    def save(self):
+        if self.path and self.dirty:
+            with open(self.path, "w", encoding="utf-8") as f: json.dump(self.data, f, indent=0, sort_keys=True)
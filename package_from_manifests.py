@@ -1,6 +1,7 @@
 ﻿import argparse, hashlib, json, os, sys, time
 from pathlib import Path
 import zipfile
+import merkle_bundle
 
 MANI_DIR = Path("manifests")
 
@@ -10,10 +11,23 @@ def hpath(p: Path) -> str:
         for chunk in iter(lambda: f.read(1<<20), b""): h.update(chunk)
     return h.hexdigest()
 
+def canonical_sha(M) -> str:
+    return hashlib.sha256(json.dumps(M, sort_keys=True).encode()).hexdigest()
+
+def sidecar_refs(obj):
+    """Every {"sidecar": "npy", "path", "sha256", ...} reference inside a manifest."""
+    if isinstance(obj, dict):
+        if obj.get("sidecar") == "npy":
+            yield obj; return
+        for v in obj.values(): yield from sidecar_refs(v)
+    elif isinstance(obj, list):
+        for v in obj: yield from sidecar_refs(v)
+
 def claims_from_manifests(objs):
     claims = []; ts = time.strftime("%Y-%m-%dT%H:%M:%S%z")
     for name, M in objs.items():
         cid = M.get("capsule_id") or M.get("capsule")
+        mh = canonical_sha(M)
         if cid == "transition_markov" or cid == "taxi_markov":
             H = M["metrics"]["entropy_rate_bits_per_step"]
             LZ = M["metrics"]["lz78_bits_per_symbol"]
@@ -24,7 +38,7 @@ def claims_from_manifests(objs):
                 "timestamp": ts,
                 "claim": f"OD entropy-rate on {src} is {H:.6f} bits/step; LZ78 proxy {LZ:.6f}; gap {gap:.6f} bits/step.",
                 "falsification": "Rebuild P from D|P counts; recompute pi; re-evaluate H_rate and LZ78 on same policy.",
-                "hash": hashlib.sha256(json.dumps(M, sort_keys=True).encode()).hexdigest()
+                "hash": mh
             })
         if cid == "interval_bmo_chr" or cid == "rmsk_bmo_chr":
             bmo = M["metrics"]["bmo_star"]
@@ -37,8 +51,19 @@ def claims_from_manifests(objs):
                 "timestamp": ts,
                 "claim": f"Interval coverage on {chrom} (win={win}) has BMO*={bmo:.6f}; John–Nirenberg ceiling proxy {ceil:.6e}.",
                 "falsification": "Recompute windowed coverage; rescan blocks {16,32,64}; compare BMO* and ceiling proxy.",
-                "hash": hashlib.sha256(json.dumps(M, sort_keys=True).encode()).hexdigest()
+                "hash": mh
             })
+            sweep = M["metrics"].get("win_sweep")
+            if sweep:
+                star = [r[sweep["columns"].index("bmo_star")] for r in sweep["rows"]]
+                sizes = [r[0] for r in sweep["rows"]]
+                claims.append({
+                    "capsule": "interval_bmo_chr",
+                    "timestamp": ts,
+                    "claim": f"Across windows {sizes[0]:,}–{sizes[-1]:,} bp on {chrom} ({len(sizes)} scales), BMO* ranges {min(star):.6f}–{max(star):.6f}.",
+                    "falsification": f"Recompute coverage at {sweep['base_bp']} bp; aggregate to each window size; rescan blocks {{16,32,64}} per scale.",
+                    "hash": mh
+                })
         if cid == "graph_trace" or cid == "graph_trace":
             diff = M["metrics"]["trace_vs_spectrum_max_abs_diff"]
             src = M.get("source", name)
@@ -49,7 +74,31 @@ def claims_from_manifests(objs):
                 "timestamp": ts,
                 "claim": f"On {src}, max |Tr(A^k) - sum(lambda^k)| over k=1..{kmax} is {diff:.3e} on an induced subgraph of size {n}.",
                 "falsification": "Rebuild undirected A on the same node sample; recompute both sides for k=1..K.",
-                "hash": hashlib.sha256(json.dumps(M, sort_keys=True).encode()).hexdigest()
+                "hash": mh
+            })
+        if cid == "graph_trace_ensemble":
+            Mm = M["metrics"]
+            src = M.get("source", name)
+            kmax = max(Mm["k_tested"])
+            claims.append({
+                "capsule": "graph_trace_ensemble",
+                "timestamp": ts,
+                "claim": f"On {src}, over {Mm['n_samples']} induced subgraphs of size {Mm['n_nodes']}, max_k |Tr(A^k) - sum(lambda^k)| (k=1..{kmax}) has mean {Mm['gap_mean']:.3e}, q95 {Mm['gap_quantiles']['q95']:.3e}, worst {Mm['gap_worst']:.3e} (seed {Mm['gap_worst_seed']}).",
+                "falsification": "Load the node-sample sidecar (seeds x n_max); rebuild each induced A; recompute both sides for k=1..K and the summary statistics.",
+                "hash": mh
+            })
+        if cid == "graph_spectral_slq":
+            lmax = M["metrics"]["lambda_top"][0]
+            z = M["metrics"]["moments_max_abs_z"]
+            src = M.get("source", name)
+            n = M["metrics"]["n_nodes"]
+            P = M["parameters"]["probes"]
+            claims.append({
+                "capsule": "graph_spectral_slq",
+                "timestamp": ts,
+                "claim": f"On {src} (full graph, n={n}), lambda_max={lmax:.6f}; SLQ moment estimates ({P} probes) sit within {z if z is not None else 0.0:.2f} stderr of exact Tr(A^k), k<=3.",
+                "falsification": "Rebuild sparse A from the edge list; rerun eigsh and SLQ with the same seed/probes; compare moments against exact traces.",
+                "hash": mh
             })
     return {"claims": claims, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
 
@@ -57,6 +106,7 @@ def main():
     p = argparse.ArgumentParser()
     p.add_argument("--mani-dir", default="manifests")
     p.add_argument("--out-zip-name", default=None, help="Optional fixed name; otherwise freeze_<MONTH>_<hashprefix>.zip")
+    p.add_argument("--cache", default=None, help="Merkle leaf cache (default <mani-dir>/.merkle_cache)")
     args = p.parse_args()
 
     md = Path(args.mani_dir)
@@ -64,24 +114,31 @@ def main():
         print("ERROR: manifests/ missing", file=sys.stderr); sys.exit(2)
 
     # Load manifests present
-    want = ["taxi_markov.json","rmsk_chr1_bmo.json","wiki_vote_trace.json"]
-    present = [w for w in want if (md/w).exists()]
     objs = {}
     for fn in sorted([p for p in md.glob("*.json") if p.name not in ("claims.json","provenance.json")]):
         try:
-            objs[fn.name] = json.load(open(fn, "rb"))
+            with open(fn, "rb") as f: objs[fn.name] = json.load(f)
         except Exception as e:
             print(f"WARNING: skip {fn.name}: {e}", file=sys.stderr)
 
-    # Compute canonical bundle hash
-    if all((md/w).exists() for w in want):
-        bundle = json.dumps({"taxi": objs["taxi_markov.json"],
-                             "rmsk": objs["rmsk_chr1_bmo.json"],
-                             "graph": objs["wiki_vote_trace.json"]}, sort_keys=True).encode()
-    else:
-        # fall back: stable dict by filename
-        bundle = json.dumps({k: objs[k] for k in sorted(objs.keys())}, sort_keys=True).encode()
-    bundle_sha = hashlib.sha256(bundle).hexdigest()
+    # Merkle bundle hash over per-manifest canonical leaves (any set of manifests)
+    file_sha = {k: hpath(md/k) for k in sorted(objs.keys())}
+    cache = merkle_bundle.LeafCache(args.cache or str(md/".merkle_cache"))
+    leaves = {k: cache.leaf(k, file_sha[k], lambda k=k: objs[k]) for k in file_sha}
+    cache.save()
+    bundle_sha, proofs = merkle_bundle.build(leaves)
+
+    # sidecar arrays referenced by the manifests: content-addressed, verified before packaging
+    sidecars = {}
+    for k in sorted(objs.keys()):
+        for ref in sidecar_refs(objs[k]):
+            q = md/ref["path"]
+            if not q.exists():
+                print(f"ERROR: {k}: sidecar {ref['path']} missing", file=sys.stderr); sys.exit(2)
+            got = hpath(q)
+            if got != ref["sha256"]:
+                print(f"ERROR: {k}: sidecar {ref['path']} sha256 {got} != {ref['sha256']}", file=sys.stderr); sys.exit(2)
+            sidecars[ref["path"]] = {"sha256": got}
 
     # claims.json
     claims = claims_from_manifests(objs)
@@ -93,7 +150,10 @@ def main():
         "python": {"version": sys.version},
         "packages": {},
         "bundle_sha256": bundle_sha,
-        "manifests": { str((md/k).as_posix()): {"sha256": hpath(md/k)} for k in sorted(objs.keys()) }
+        "bundle_scheme": merkle_bundle.SCHEME,
+        "merkle": {"leaves": leaves, "proofs": proofs},
+        "manifests": { str((md/k).as_posix()): {"sha256": file_sha[k]} for k in sorted(objs.keys()) },
+        "sidecars": sidecars
     }
     prov_path = md/"provenance.json"
     prov_path.write_text(json.dumps(prov, indent=2), encoding="utf-8")
@@ -102,9 +162,10 @@ def main():
     name = args.out_zip_name or f"freeze_{month}_{bundle_sha[:12]}.zip"
 
     with zipfile.ZipFile(name, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        for p in ["taxi_markov.json","rmsk_chr1_bmo.json","wiki_vote_trace.json","claims.json","provenance.json"]:
-            q = md/p
-            if q.exists(): z.write(q, arcname=p)
+        for p in sorted(objs.keys()) + ["claims.json","provenance.json"]:
+            z.write(md/p, arcname=p)
+        for p in sorted(sidecars):
+            z.write(md/p, arcname=p)
     print("ZIP", name)
 
 if __name__ == "__main__":
@@ -1,20 +1,39 @@
-﻿import sys, os, json, zipfile, hashlib
+﻿import argparse, contextlib, fnmatch, io, math, re, sys, os, json, tempfile, zipfile, hashlib
+from concurrent.futures import ProcessPoolExecutor
+import merkle_bundle
 
 def h_bytes(b: bytes) -> str:
     h = hashlib.sha256(); h.update(b); return h.hexdigest()
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python verify_zip.py <freeze_YYYY-MM_<hashprefix>.zip>"); sys.exit(2)
-    zip_path = sys.argv[1]
-    if not os.path.exists(zip_path):
-        print(f"ERROR: zip not found: {zip_path}"); sys.exit(2)
+def verify_member(zip_path, member):
+    """Check one manifest against the Merkle root using only provenance.json and that member."""
+    with zipfile.ZipFile(zip_path, "r") as z:
+        prov = json.loads(z.read("provenance.json"))
+        if prov.get("bundle_scheme") != merkle_bundle.SCHEME:
+            print("ERROR: --member needs a Merkle bundle (legacy freeze)"); return False
+        proof = prov.get("merkle", {}).get("proofs", {}).get(member)
+        if proof is None or member not in z.namelist():
+            print(f"ERROR: {member} not in bundle"); return False
+        raw = z.read(member)
+    leaf = merkle_bundle.leaf_hash(member, merkle_bundle.canonical(json.loads(raw)))
+    root = merkle_bundle.root_from_proof(leaf, proof)
+    exp = prov.get("bundle_sha256", "")
+    file_ok = any(os.path.basename(k) == member and meta.get("sha256") == h_bytes(raw)
+                  for k, meta in prov.get("manifests", {}).items())
+    print(f"ZIP: {os.path.basename(zip_path)}  member: {member}")
+    print(f"leaf          = {leaf}")
+    print(f"proof length  = {len(proof)}")
+    print(f"root          = {root}")
+    print(f"expected      = {exp} {'OK' if root == exp else 'MISMATCH'}")
+    print(f"file digest   {'OK' if file_ok else 'MISMATCH'}")
+    return root == exp and file_ok
 
+def verify_hashes(zip_path):
     ok = True
     with zipfile.ZipFile(zip_path, "r") as z:
         names = set(z.namelist())
         if "provenance.json" not in names:
-            print("ERROR: provenance.json missing from zip"); sys.exit(1)
+            print("ERROR: provenance.json missing from zip"); return False
         prov = json.loads(z.read("provenance.json"))
         expect_bundle = prov.get("bundle_sha256", "")
         expect_files  = prov.get("manifests", {})
@@ -29,8 +48,33 @@ def main():
             print(f"{base:22} {got}  {'OK' if got==exp else 'MISMATCH'}")
             ok = ok and (got == exp)
 
+        # sidecar .npy arrays: named by their own sha256 and listed in provenance
+        sidecars = prov.get("sidecars", {})
+        if sidecars: print("— sidecar digests —")
+        for p, meta in sidecars.items():
+            if p not in names:
+                print(f"{p} MISSING"); ok = False; continue
+            got = h_bytes(z.read(p)); exp = meta.get("sha256", "")
+            good = got == exp and os.path.basename(p) == f"{exp}.npy"
+            print(f"{p}  {'OK' if good else 'MISMATCH'}")
+            ok = ok and good
+
         need = ["taxi_markov.json", "rmsk_chr1_bmo.json", "wiki_vote_trace.json"]
-        if all(n in names for n in need):
+        if prov.get("bundle_scheme") == merkle_bundle.SCHEME:
+            members = sorted(os.path.basename(k) for k in expect_files)
+            if all(n in names for n in members):
+                leaves = {n: merkle_bundle.leaf_hash(n, merkle_bundle.canonical(json.loads(z.read(n)))) for n in members}
+                got_bundle, _ = merkle_bundle.build(leaves)
+                print("\n— bundle hash (merkle) —")
+                stale = [n for n, h in leaves.items() if prov.get("merkle", {}).get("leaves", {}).get(n) != h]
+                for n in stale: print(f"leaf {n:22} MISMATCH")
+                print("bundle_sha256 =", got_bundle)
+                print("expected      =", expect_bundle, ("OK" if got_bundle==expect_bundle else "MISMATCH"))
+                ok = ok and (got_bundle == expect_bundle) and not stale
+            else:
+                print("WARN: missing one or more manifests needed to recompute bundle hash")
+                ok = False
+        elif all(n in names for n in need):
             m1 = json.loads(z.read("taxi_markov.json"))
             m2 = json.loads(z.read("rmsk_chr1_bmo.json"))
             m3 = json.loads(z.read("wiki_vote_trace.json"))
@@ -43,7 +87,228 @@ def main():
         else:
             print("WARN: missing one or more manifests needed to recompute bundle hash")
             ok = False
+    return ok
+
+# ---------- replay ----------
+# (glob on dotted metric path, rel tol, abs tol); rel=None means not compared. First match wins.
+TOLERANCES = [
+    ("trace_vs_spectrum_max_abs_diff", 0.0, 1e-6),
+    ("gap_mean", 0.0, 1e-6), ("gap_quantiles.*", 0.0, 1e-6), ("gap_worst", 0.0, 1e-6),
+    ("gap_worst_seed", None, None),
+    ("lambda_*", 1e-8, 1e-8),
+    ("moments_*", 1e-8, 1e-6),
+    ("density.*", 1e-8, 1e-8),
+    ("*", 1e-9, 1e-12),
+]
+
+CAPSULE_ARGS = {
+    # capsule_id -> (subcommand, [(parameter, flag)], [(parameter, store_true flag)])
+    "transition_markov": ("transition", [("origin_field", "--origin"), ("dest_field", "--dest"), ("stride", "--stride"),
+                                         ("lz_cap", "--lz-cap"), ("order", "--order"), ("time_col", "--time-col"),
+                                         ("window", "--window"), ("window_step", "--window-step"),
+                                         ("null_policy", "--nulls")], []),
+    "interval_bmo_chr": ("interval-bmo", [("chrom", "--chrom"), ("window", "--win"), ("chrom_col", "--chrom-col"),
+                                          ("start_col", "--start-col"), ("end_col", "--end-col"),
+                                          ("win_sweep", "--win-sweep"), ("sweep_base", "--sweep-base")], []),
+    "graph_trace": ("graph", [("n_max", "--n-max"), ("k_max", "--k-max"), ("seed", "--seed")], [("directed", "--directed")]),
+    "graph_trace_ensemble": ("graph", [("n_max", "--n-max"), ("k_max", "--k-max"), ("seeds", "--seeds")],
+                             [("directed", "--directed")]),
+    "graph_spectral_slq": ("graph", [("k_max", "--k-max"), ("probes", "--probes"), ("lanczos_steps", "--lanczos"),
+                                     ("top_k", "--top-k"), ("bins", "--bins"), ("seed", "--seed")], [("directed", "--directed")]),
+}
+ALIASES = {"taxi_markov": "transition_markov", "rmsk_bmo_chr": "interval_bmo_chr"}
+
+def flatten(obj, prefix=""):
+    if isinstance(obj, dict):
+        for k, v in obj.items(): yield from flatten(v, f"{prefix}{k}.")
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj): yield from flatten(v, f"{prefix}{i}.")
+    else:
+        yield prefix[:-1], obj
+
+MISSING = "<not recomputed>"
+
+def compare_metrics(frozen, fresh):
+    """
+    Drift rows (path, frozen, recomputed, abs diff). A frozen metric the fresh run does not
+    produce is a row with recomputed=MISSING; null frozen values may be absent.
+    """
+    got = dict(flatten(fresh)); drift = []
+    for path, exp in flatten(frozen):
+        rel, tol = next((r, a) for pat, r, a in TOLERANCES
+                        if fnmatch.fnmatch(path, pat) or fnmatch.fnmatch(path.split(".")[0], pat))
+        if rel is None: continue
+        if path not in got:
+            if exp is not None: drift.append((path, exp, MISSING, None))
+            continue
+        val = got[path]
+        if isinstance(exp, (int, float)) and isinstance(val, (int, float)) and not isinstance(exp, bool):
+            d = abs(float(val) - float(exp))
+            if not (d <= tol + rel * abs(float(exp)) or (math.isnan(exp) and math.isnan(val))):
+                drift.append((path, exp, val, d))
+        elif exp != val:
+            drift.append((path, exp, val, None))
+    return drift
+
+class ShaIndex:
+    """sha256 of local files keyed by (abspath, size, mtime_ns), optionally persisted between nightly runs."""
+    def __init__(self, path=None):
+        self.path = path; self.data = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f: self.data = json.load(f)
+            except Exception: self.data = {}
+
+    def sha(self, p):
+        st = os.stat(p); key = f"{os.path.abspath(p)}|{st.st_size}|{st.st_mtime_ns}"
+        if key not in self.data:
+            h = hashlib.sha256()
+            with open(p, "rb") as f:
+                for chunk in iter(lambda: f.read(1<<20), b""): h.update(chunk)
+            self.data[key] = h.hexdigest()
+        return self.data[key]
 
+    def save(self):
+        if self.path:
+            with open(self.path, "w", encoding="utf-8") as f: json.dump(self.data, f, indent=0)
+
+def locate(ref, search_dirs, index):
+    """Find a file recorded as {path, sha256}: the recorded path first, then its basename in each search dir."""
+    base = re.split(r"[\\/]", ref["path"])[-1]
+    for cand in [ref["path"]] + [os.path.join(d, base) for d in search_dirs]:
+        if os.path.isfile(cand) and index.sha(cand) == ref["sha256"]:
+            return cand
+    return None
+
+def capsule_of(M):
+    cid = M.get("capsule_id") or M.get("capsule")
+    return ALIASES.get(cid, cid)
+
+def is_merged(M) -> bool:
+    # 'capsules_cli merge' output: its inputs are the checkpoint parts, not raw data
+    return "merged_parts" in M.get("parameters", {})
+
+def replay_manifest(job):
+    """
+    Re-derive one manifest's metrics: merge outputs from their located parts, others from
+    raw inputs, falling back to the frozen checkpoint only when the inputs are not found.
+    A fallback can only re-derive what the checkpoint holds, so metrics it cannot produce
+    make the row SKIP, never OK. Any failure is an ERROR row.
+    """
+    name, M, cp, paths = job
+    err = io.StringIO()
+    try:
+        import capsules_cli
+        cid = capsule_of(M)
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(err):
+            out = os.path.join(tmp, "replay.json")
+            if is_merged(M):
+                mode = f"merge of {len(paths)} parts"
+                capsules_cli.capsule_merge(argparse.Namespace(checkpoints=paths, out=out))
+            elif cp:
+                mode = "checkpoint fallback (raw input not found)"
+                capsules_cli.capsule_merge(argparse.Namespace(checkpoints=[cp], out=out))
+            else:
+                mode = "inputs"
+                cmd, flags, switches = CAPSULE_ARGS[cid]
+                P = M.get("parameters", {})
+                argv = [cmd, "--input", paths[0], "--out", out]
+                for key, flag in flags:
+                    v = P.get(key)
+                    if v is not None: argv += [flag, ",".join(map(str, v)) if isinstance(v, list) else str(v)]
+                argv += [flag for key, flag in switches if P.get(key)]
+                if cid == "graph_spectral_slq": argv += ["--spectral", "slq"]
+                if cid == "transition_markov" and "null_policy" not in P and not P.get("time_col"):
+                    argv += ["--nulls", "columns"]   # frozen before null_policy was recorded
+                if cmd == "graph": argv += ["--workers", "1"]   # already inside the replay pool
+                args = capsules_cli.build_parser().parse_args(argv)
+                args.func(args)
+            with open(out, "rb") as f: fresh = json.load(f)
+    except BaseException as e:   # argparse exits with SystemExit; a nightly run must keep going
+        if isinstance(e, KeyboardInterrupt): raise
+        msg = (err.getvalue().strip().splitlines() or [""])[-1]   # argparse's reason for SystemExit
+        return name, "ERROR", msg or f"{type(e).__name__}: {e}", []
+    drift = compare_metrics(M.get("metrics", {}), fresh.get("metrics", {}))
+    missing = [r for r in drift if r[2] == MISSING]
+    if cp and not is_merged(M) and missing and len(missing) == len(drift):
+        return name, "SKIP", f"{mode}; {len(missing)} frozen metric values not re-derivable", missing
+    return name, ("DRIFT" if drift else "OK"), mode, drift
+
+def replay(zip_paths, search_dirs, jobs, index):
+    # identical manifests across freezes (same canonical hash) are replayed once
+    work = {}
+    for zp in zip_paths:
+        with zipfile.ZipFile(zp, "r") as z:
+            prov = json.loads(z.read("provenance.json"))
+            for k in prov.get("manifests", {}):
+                base = os.path.basename(k)
+                if base not in z.namelist(): continue
+                M = json.loads(z.read(base))
+                key = hashlib.sha256(merkle_bundle.canonical(M)).hexdigest()
+                work.setdefault(key, [f"{os.path.basename(zp)}:{base}", M, 0])[2] += 1
+    tasks, results = [], {}
+    for label, M, _ in work.values():
+        ck = M.get("checkpoint")
+        cp = locate(ck, search_dirs, index) if ck else None
+        paths = [locate(inp, search_dirs, index) for inp in M.get("inputs", [])]
+        raw = bool(paths) and None not in paths
+        if is_merged(M):
+            if raw: tasks.append((label, M, None, paths))
+            else: results[label] = (label, "SKIP", "merge part not found by sha256", [])
+        elif raw and capsule_of(M) in CAPSULE_ARGS:
+            tasks.append((label, M, None, paths))
+        elif cp:
+            tasks.append((label, M, cp, paths))
+        elif capsule_of(M) not in CAPSULE_ARGS:
+            results[label] = (label, "SKIP", f"no replay recipe for {capsule_of(M)}", [])
+        else:
+            results[label] = (label, "SKIP", "input not found by sha256", [])
+    index.save()
+    print(f"\n— replay ({len(work)} distinct manifests, {len(tasks)} runnable, {jobs} workers) —")
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            for r in ex.map(replay_manifest, tasks): results[r[0]] = r
+    else:
+        for t in tasks:
+            r = replay_manifest(t); results[r[0]] = r
+    ok = True
+    for label, _, n in work.values():
+        _, status, info, drift = results[label]
+        shared = f" (shared by {n} freezes)" if n > 1 else ""
+        print(f"{label:48} {status:5} {info}{shared}")
+        for path, exp, val, d in drift[:20]:
+            print(f"    {path}: frozen={exp} recomputed={val}" + (f" |Δ|={d:.3e}" if d is not None else ""))
+        if len(drift) > 20: print(f"    ... {len(drift) - 20} more")
+        ok = ok and status not in ("DRIFT", "ERROR")
+    return ok
+
+def main():
+    ap = argparse.ArgumentParser(description="Verify freeze_YYYY-MM_<hashprefix>.zip files")
+    ap.add_argument("zips", nargs="+")
+    ap.add_argument("--member", default=None, help="verify only this manifest via its Merkle proof")
+    ap.add_argument("--replay", action="store_true", help="re-derive metrics from recorded inputs and compare")
+    ap.add_argument("--data-dir", action="append", default=None,
+                    help="where to look for inputs/checkpoints by basename + sha256 (repeatable; default $HARSH_DATA_DIR, ../data, data)")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--sha-cache", default=None, help="persist input sha256 results here between runs")
+    args = ap.parse_args()
+    for zip_path in args.zips:
+        if not os.path.exists(zip_path):
+            print(f"ERROR: zip not found: {zip_path}"); sys.exit(2)
+    if args.member:
+        ok = all(verify_member(zp, args.member) for zp in args.zips)
+        print("\nMEMBER OK ✅" if ok else "\nVERIFICATION FAILED ❌")
+        sys.exit(0 if ok else 1)
+
+    ok = True
+    for zip_path in args.zips:
+        ok = verify_hashes(zip_path) and ok
+    if args.replay:
+        dirs = args.data_dir or [d for d in os.environ.get("HARSH_DATA_DIR", "").split(os.pathsep) if d] or \
+            [os.path.join("..", "data"), "data"]
+        dirs = dirs + ["manifests", "."]
+        ok = replay(args.zips, dirs, args.jobs, ShaIndex(args.sha_cache)) and ok
     print("\nALL OK ✅" if ok else "\nVERIFICATION FAILED ❌")
     sys.exit(0 if ok else 1)
 